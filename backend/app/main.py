@@ -1,14 +1,36 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 import asyncio
 import aiohttp
+import logging
 import os
-from .database import engine, Base
+import threading
+import time
+from .database import engine, Base, run_db
+from .migrations import upgrade_schema
 from .routers import products, upload, webhooks
+from .services.bulk_delete import reclaim_trash
+from .services.bulk_load import restore_indexes
+from .services.catalogue_stats import initialize_stats
+from .services.import_scheduler import import_scheduler
+from .services.job_store import cleanup_jobs
+from .services.metrics import REQUEST_LATENCY, registry
+from .services.search_index import install_search_index
+from .services.upload_sessions import cleanup_upload_sessions
+from .services.webhook_service import delivery_engine, load_subscriptions
+
+logger = logging.getLogger(__name__)
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
+install_search_index(engine)
+# Indexes dropped by a bulk load that was interrupted
+restore_indexes(engine)
+# Product counts of databases created before they were maintained
+initialize_stats(engine)
 
 
 async def keep_alive_task():
@@ -34,18 +56,57 @@ async def keep_alive_task():
         await asyncio.sleep(600)
 
 
+async def job_cleanup_task():
+    """Background task that evicts expired import jobs and abandoned upload sessions"""
+    interval = int(os.getenv("JOB_CLEANUP_INTERVAL", "300"))
+    
+    while True:
+        try:
+            # Queued imports are waiting, not stale
+            await run_db(import_scheduler.heartbeat)
+            await run_db(cleanup_jobs)
+            await run_db(cleanup_upload_sessions)
+        except Exception:
+            # Database may be busy with an import; try again next round
+            pass
+        
+        await asyncio.sleep(interval)
+
+
+def log_reclaim_failure(future: asyncio.Future) -> None:
+    """Report a failed startup reclaim; the trash is retried at the next startup"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Reclaiming bulk delete trash failed", exc_info=future.exception())
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events"""
-    # Startup: Start keep-alive task
-    keep_alive = asyncio.create_task(keep_alive_task())
+    # Startup: Load webhook subscriptions, start delivery and background tasks
+    await run_db(load_subscriptions)
+    await delivery_engine.start()
+    # Finish reclaiming space from bulk deletes interrupted by a restart
+    reclaim_stop = threading.Event()
+    reclaiming = asyncio.get_running_loop().run_in_executor(None, reclaim_trash, None, None, reclaim_stop)
+    reclaiming.add_done_callback(log_reclaim_failure)
+    background_tasks = [
+        asyncio.create_task(keep_alive_task()),
+        asyncio.create_task(job_cleanup_task())
+    ]
     yield
-    # Shutdown: Cancel keep-alive task
-    keep_alive.cancel()
-    try:
-        await keep_alive
-    except asyncio.CancelledError:
-        pass
+    # Shutdown: Cancel background tasks
+    for task in background_tasks:
+        task.cancel()
+    for task in background_tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    # A reclaim still running stops after its current chunk (failures are already logged)
+    reclaim_stop.set()
+    await asyncio.gather(reclaiming, return_exceptions=True)
+    await run_db(import_scheduler.stop)
+    await delivery_engine.stop()
 
 
 app = FastAPI(
@@ -62,6 +123,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+
+def _route_template(scope: dict) -> str:
+    """Path template of the matched route (e.g. /api/products/{product_id}), to bound label cardinality"""
+    route = scope.get("route")
+    path_regex = getattr(route, "path_regex", None)
+    if path_regex is None:
+        return "unmatched"
+    # Routes of an included router may only know their own path; the router
+    # prefix is then the part of the request path in front of what they match
+    path = scope["path"]
+    for cut in [i for i, char in enumerate(path) if char == "/"] + [len(path)]:
+        if path_regex.match(path[cut:]):
+            return path[:cut] + route.path
+    return route.path
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Per-route latency histogram; labelled by route template, not raw path"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    REQUEST_LATENCY.observe(
+        time.perf_counter() - start,
+        request.method,
+        _route_template(request.scope),
+        str(response.status_code)
+    )
+    return response
+
+
+def _jobs_in_flight() -> dict:
+    snapshot = import_scheduler.snapshot()
+    return {("running",): len(snapshot["running"]), ("queued",): len(snapshot["queued"])}
+
+
+# Gauges read at scrape time
+registry.gauge(
+    "importer_jobs_in_flight",
+    "Imports running or queued in this worker",
+    ("state",),
+    collect=_jobs_in_flight
+)
+registry.gauge(
+    "importer_webhook_deliveries_in_flight",
+    "Webhook requests currently being sent by this worker",
+    collect=lambda: {(): delivery_engine.in_flight}
+)
+
 # Include routers
 app.include_router(products.router, prefix="/api/products", tags=["products"])
 app.include_router(upload.router, prefix="/api/upload", tags=["upload"])
@@ -73,6 +183,12 @@ def root():
     return {"message": "CSV Product Importer API"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text-format metrics for this worker"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 def health_check():
     """Health check endpoint for Render and monitoring services"""
@@ -0,0 +1,94 @@
+import logging
+import os
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from .models import normalize_sku
+
+logger = logging.getLogger(__name__)
+
+# Set to 1 to let the sku_normalized upgrade delete older case-variant duplicates
+# (e.g. "ab-1" when "AB-1" is newer); without it the upgrade stops and lists them
+MIGRATE_DROP_CASE_DUPLICATES = os.getenv("MIGRATE_DROP_CASE_DUPLICATES", "0") == "1"
+
+
+class CaseDuplicateSkus(RuntimeError):
+    """Products whose SKUs differ only in case block the sku_normalized upgrade"""
+
+    def __init__(self, groups: dict):
+        listing = "; ".join(
+            ", ".join(f"id {product_id} ({sku!r})" for product_id, sku in group)
+            for group in groups.values()
+        )
+        super().__init__(
+            f"{len(groups)} SKU(s) are stored in more than one case: {listing}. "
+            "Delete or rename the duplicates, or set MIGRATE_DROP_CASE_DUPLICATES=1 "
+            "to keep only the newest product of each SKU."
+        )
+        self.groups = groups
+
+
+def _column_names(engine: Engine, table: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+def _case_duplicates(conn) -> dict:
+    """SKUs that older releases stored in more than one case, as normalized SKU -> [(id, sku)] oldest first"""
+    groups = {}
+    for product_id, sku in conn.execute(text("SELECT id, sku FROM products ORDER BY id")):
+        groups.setdefault(normalize_sku(sku), []).append((product_id, sku))
+    return {key: group for key, group in groups.items() if len(group) > 1}
+
+
+def _backfill_sku_normalized(conn, duplicates: dict) -> None:
+    """Populate sku_normalized for rows created before the column existed, keeping the newest of each duplicate"""
+    dropped = [entry for group in duplicates.values() for entry in group[:-1]]
+    for product_id, sku in dropped:
+        logger.warning("Dropping product id %s (SKU %r): a newer product has the same SKU in another case", product_id, sku)
+    if dropped:
+        conn.execute(
+            text("DELETE FROM products WHERE id = :id"),
+            [{"id": product_id} for product_id, _ in dropped]
+        )
+    rows = conn.execute(text("SELECT id, sku FROM products")).all()
+    if rows:
+        conn.execute(
+            text("UPDATE products SET sku_normalized = :key WHERE id = :id"),
+            [{"key": normalize_sku(sku), "id": product_id} for product_id, sku in rows]
+        )
+
+
+def upgrade_schema(engine: Engine) -> None:
+    """
+    Bring tables created by older releases up to date with the models.
+    create_all() only creates missing tables, so new columns are added here.
+    """
+    product_columns = _column_names(engine, "products")
+    job_columns = _column_names(engine, "import_jobs")
+
+    if "sku_normalized" not in product_columns:
+        # Checked before any DDL: SQLite commits ALTER TABLE immediately
+        with engine.connect() as conn:
+            duplicates = _case_duplicates(conn)
+        if duplicates and not MIGRATE_DROP_CASE_DUPLICATES:
+            raise CaseDuplicateSkus(duplicates)
+
+    with engine.begin() as conn:
+        if "sku_normalized" not in product_columns:
+            conn.execute(text("ALTER TABLE products ADD COLUMN sku_normalized VARCHAR"))
+            _backfill_sku_normalized(conn, duplicates)
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ix_products_sku_normalized "
+                "ON products (sku_normalized)"
+            ))
+
+        if "cancel_requested" not in job_columns:
+            conn.execute(text(
+                "ALTER TABLE import_jobs ADD COLUMN cancel_requested BOOLEAN NOT NULL DEFAULT FALSE"
+            ))
+        for column in ("inserted_records", "updated_records", "unchanged_records", "skipped_records"):
+            if column not in job_columns:
+                conn.execute(text(f"ALTER TABLE import_jobs ADD COLUMN {column} INTEGER"))
+
+        if "content_hash" not in product_columns:
+            # Left NULL: the first import after upgrading writes every row once
+            conn.execute(text("ALTER TABLE products ADD COLUMN content_hash VARCHAR(16)"))
@@ -1,13 +1,29 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, Text, Index, Enum as SQLEnum, event
+from sqlalchemy.orm import validates
 from sqlalchemy.sql import func
 from .database import Base
 import enum
+import hashlib
+
+
+def normalize_sku(sku: str) -> str:
+    """Normalized SKU key used for case-insensitive matching"""
+    return sku.lower()
+
+
+def product_fingerprint(name: str, description, active) -> str:
+    """Short hash of the fields an import can change; equal hashes mean nothing to write"""
+    content = f"{name}\x1f{chr(0) if description is None else description}\x1f{int(bool(active))}"
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=8).hexdigest()
 
 
 class EventType(str, enum.Enum):
     product_created = "product_created"
     product_updated = "product_updated"
     product_deleted = "product_deleted"
+    # Batched events emitted by CSV imports
+    product_batch_created = "product_batch_created"
+    product_batch_updated = "product_batch_updated"
 
 
 class Product(Base):
@@ -15,12 +31,29 @@ class Product(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     sku = Column(String, unique=True, nullable=False, index=True)
+    # Stored lower-cased SKU so case-insensitive lookups can use the unique index
+    sku_normalized = Column(String, unique=True, nullable=False, index=True)
     name = Column(String, nullable=False)
     description = Column(String, nullable=True)
     active = Column(Boolean, default=True, nullable=False)
+    # product_fingerprint() of name/description/active; NULL for rows written before it existed
+    content_hash = Column(String(16), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
+    @validates("sku")
+    def _sync_sku_normalized(self, key, value):
+        self.sku_normalized = normalize_sku(value) if value is not None else None
+        return value
+
+
+@event.listens_for(Product, "before_insert")
+@event.listens_for(Product, "before_update")
+def _sync_content_hash(mapper, connection, target):
+    target.content_hash = product_fingerprint(
+        target.name, target.description, True if target.active is None else target.active
+    )
+
 
 class Webhook(Base):
     __tablename__ = "webhooks"
@@ -31,3 +64,79 @@ class Webhook(Base):
     enabled = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+
+
+class Counter(Base):
+    """Named integer counters shared by all workers (e.g. cache version numbers)"""
+    __tablename__ = "counters"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, default=0, nullable=False)
+
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)
+    progress = Column(Float, default=0.0, nullable=False)
+    message = Column(String, nullable=True)
+    total_records = Column(Integer, nullable=True)
+    processed_records = Column(Integer, nullable=True)
+    # Outcome of the processed rows: new, changed, identical to the stored row, or invalid/duplicate
+    inserted_records = Column(Integer, nullable=True)
+    updated_records = Column(Integer, nullable=True)
+    unchanged_records = Column(Integer, nullable=True)
+    skipped_records = Column(Integer, nullable=True)
+    # Set by the cancel endpoint; the importer stops at its next batch boundary
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class WebhookDelivery(Base):
+    """Outbox row for one webhook POST; survives restarts until delivered or given up"""
+    __tablename__ = "webhook_outbox"
+
+    id = Column(Integer, primary_key=True)
+    webhook_id = Column(Integer, nullable=True)
+    url = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(String, default="pending", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_webhook_outbox_due", "status", "next_attempt_at"),
+    )
+
+
+class ImportedFile(Base):
+    """Checksum of a fully imported file and the catalogue generation it produced"""
+    __tablename__ = "imported_files"
+
+    checksum = Column(String, primary_key=True)
+    job_id = Column(String, nullable=False)
+    total_records = Column(Integer, nullable=False)
+    catalogue_generation = Column(Integer, nullable=False)
+    imported_at = Column(DateTime(timezone=True), nullable=False)
+
+
+class UploadSession(Base):
+    """A chunked upload being written to a spool file; `received` is the acknowledged offset"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)
+    filename = Column(String, nullable=False)
+    # Declared total size in bytes; NULL when the client did not know it up front
+    size = Column(Integer, nullable=True)
+    received = Column(Integer, default=0, nullable=False)
+    spool_path = Column(String, nullable=False)
+    status = Column(String, default="open", nullable=False)
+    job_id = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
@@ -1,16 +1,74 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
-from typing import Optional
-from ..database import get_db
-from ..models import Product
-from ..schemas import ProductCreate, ProductUpdate, ProductResponse, ProductListResponse
-from ..services.webhook_service import trigger_webhooks
+from typing import Callable, Hashable, Optional
+import json
+from ..database import begin_immediate, get_db, run_db
+from ..models import Product, normalize_sku
+from ..schemas import ProductCreate, ProductUpdate, ProductResponse, ProductListResponse, ProductStatsResponse, BulkDeleteResponse, BatchUpsertResponse
+from ..services.pagination import CountCache, decode_cursor, encode_cursor
+from ..services.product_json import ID_POSITION, encode_product, encode_product_page, select_products
+from ..services.batch_upsert import BATCH_MAX_ITEMS, BatchWriter, is_ndjson, iter_ndjson_lines
+from ..services.counters import CATALOGUE_GENERATION, bump_counter, get_counter
+from ..services.bulk_delete import reclaim_trash, swap_out_products
+from ..services.catalogue_stats import adjust_stats, get_stats
+from ..services.export import EXPORT_FORMATS, iter_export
+from ..services.job_store import create_job, create_job_id, update_job
+from ..services.metrics import SQLITE_LOCK_WAIT
+from ..services.response_cache import CACHE_REQUESTS, ResponseCache, catalogue_etag, etag_matches
+from ..services.search_index import contains_filter
+from ..services.webhook_service import delivery_engine, enqueue_webhooks, product_payload
 from ..models import EventType
-import asyncio
 
 router = APIRouter()
 
+# Filtered totals shared by list requests in this worker
+product_counts = CountCache()
+# Serialized list pages and products of the current catalogue generation
+product_responses = ResponseCache()
+
+
+def cached_response(db: Session, key: Hashable, if_none_match: Optional[str], build: Callable[[int], bytes]) -> Response:
+    """
+    Answer a read from the catalogue generation: 304 if the client's ETag is
+    current, else the cached body, else build(generation) and cache it.
+    """
+    # Read the generation before the data, so a racing write can only make the body newer
+    generation = get_counter(db, CATALOGUE_GENERATION)
+    etag = catalogue_etag(generation, key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        CACHE_REQUESTS.inc(1, "not_modified")
+        return Response(status_code=304, headers=headers)
+    
+    body = product_responses.get(generation, key)
+    if body is None:
+        CACHE_REQUESTS.inc(1, "miss")
+        body = build(generation)
+        product_responses.put(generation, key, body)
+    else:
+        CACHE_REQUESTS.inc(1, "hit")
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def product_filters(
+    sku: Optional[str],
+    name: Optional[str],
+    description: Optional[str],
+    active: Optional[bool]
+) -> list:
+    """Filter conditions shared by listing and export (substring filters use the search index)"""
+    filters = []
+    if sku:
+        filters.append(contains_filter("sku", sku))
+    if name:
+        filters.append(contains_filter("name", name))
+    if description:
+        filters.append(contains_filter("description", description))
+    if active is not None:
+        filters.append(Product.active == active)
+    return filters
+
 
 @router.get("", response_model=ProductListResponse)
 def list_products(
@@ -20,54 +78,114 @@ def list_products(
     name: Optional[str] = None,
     description: Optional[str] = None,
     active: Optional[bool] = None,
+    cursor: Optional[str] = Query(None, description="next_cursor from a previous page; seeks by id instead of OFFSET"),
+    include_total: bool = Query(True, description="Set to false to skip counting the filtered set"),
+    if_none_match: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
-    """List products with filtering and pagination"""
-    query = db.query(Product)
-    
-    # Apply filters
-    if sku:
-        query = query.filter(func.lower(Product.sku).contains(sku.lower()))
-    if name:
-        query = query.filter(func.lower(Product.name).contains(name.lower()))
-    if description:
-        query = query.filter(func.lower(Product.description).contains(description.lower()))
-    if active is not None:
-        query = query.filter(Product.active == active)
+    """
+    List products with filtering and pagination.
+    Pages are cached per catalogue generation and carry an ETag for conditional requests.
+    """
+    key = ("list", page, page_size, sku, name, description, active, cursor, include_total)
+    return cached_response(db, key, if_none_match, lambda generation: build_product_page(
+        db, generation, page, page_size, sku, name, description, active, cursor, include_total
+    ))
+
+
+def build_product_page(
+    db: Session,
+    generation: int,
+    page: int,
+    page_size: int,
+    sku: Optional[str],
+    name: Optional[str],
+    description: Optional[str],
+    active: Optional[bool],
+    cursor: Optional[str],
+    include_total: bool
+) -> bytes:
+    """Query one page of the product list as column tuples and encode it straight to JSON"""
+    filters = product_filters(sku, name, description, active)
     
-    # Get total count
-    total = query.count()
+    # Get total count: from the maintained counters unless a text filter is set,
+    # else counted (cached briefly per filter combination and generation)
+    total = None
+    total_pages = None
+    if include_total:
+        if not (sku or name or description):
+            stats = get_stats(db)
+            total = stats["total"] if active is None else stats["active" if active else "inactive"]
+        else:
+            count = db.query(Product).filter(*filters).count
+            total = product_counts.get_or_count((generation, sku, name, description, active), count)
+        total_pages = (total + page_size - 1) // page_size
     
-    # Apply pagination
-    offset = (page - 1) * page_size
-    products = query.order_by(Product.id).offset(offset).limit(page_size).all()
+    # Apply pagination: keyset seek on the primary key when a cursor is given
+    query = select_products(filters).order_by(Product.id)
+    if cursor:
+        try:
+            after_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(Product.id > after_id)
+    else:
+        query = query.offset((page - 1) * page_size)
     
-    total_pages = (total + page_size - 1) // page_size
+    # Fetch one extra row to know whether another page follows
+    rows = db.connection().execute(query.limit(page_size + 1)).all()
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1][ID_POSITION])
     
-    return ProductListResponse(
-        items=products,
-        total=total,
-        page=page,
-        page_size=page_size,
-        total_pages=total_pages
+    return encode_product_page(rows, total, page, page_size, total_pages, next_cursor)
+
+
+@router.get("/export")
+def export_products(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = Query(False, description="Compress the stream with gzip"),
+    sku: Optional[str] = None,
+    name: Optional[str] = None,
+    description: Optional[str] = None,
+    active: Optional[bool] = None
+):
+    """Stream all products, or the filtered subset, as CSV or NDJSON"""
+    filename = f"products.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        iter_export(format, product_filters(sku, name, description, active), compress=gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
 
+@router.get("/stats", response_model=ProductStatsResponse)
+def product_stats(if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    """Total, active and inactive product counts (ETagged like the list)"""
+    return cached_response(db, ("stats",), if_none_match, lambda generation: json.dumps(
+        get_stats(db), separators=(",", ":")
+    ).encode("utf-8"))
+
+
 @router.get("/{product_id}", response_model=ProductResponse)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    """Get a single product by ID"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
+def get_product(product_id: int, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    """Get a single product by ID (cached and ETagged like the list)"""
+    def build(generation: int) -> bytes:
+        row = db.connection().execute(select_products([Product.id == product_id])).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return encode_product(row)
+    
+    return cached_response(db, ("product", product_id), if_none_match, build)
 
 
-@router.post("", response_model=ProductResponse, status_code=201)
-async def create_product(product: ProductCreate, db: Session = Depends(get_db)):
-    """Create a new product"""
+def insert_product(db: Session, product: ProductCreate) -> Product:
+    """Insert a product and queue its webhooks in one transaction"""
+    SQLITE_LOCK_WAIT.observe(begin_immediate(db), "crud")
     # Check for duplicate SKU (case-insensitive)
     existing = db.query(Product).filter(
-        func.lower(Product.sku) == product.sku.lower()
+        Product.sku_normalized == normalize_sku(product.sku)
     ).first()
     
     if existing:
@@ -78,37 +196,81 @@ async def create_product(product: ProductCreate, db: Session = Depends(get_db)):
     
     db_product = Product(**product.dict())
     db.add(db_product)
+    db.flush()
+    
+    # Queue webhooks in the same transaction
+    enqueue_webhooks(db, EventType.product_created, product_payload(db_product))
+    bump_counter(db, CATALOGUE_GENERATION)
+    adjust_stats(db, total=1, active=int(bool(db_product.active)))
     db.commit()
     db.refresh(db_product)
-    
-    # Trigger webhook asynchronously
-    product_data = {
-        "id": db_product.id,
-        "sku": db_product.sku,
-        "name": db_product.name,
-        "description": db_product.description,
-        "active": db_product.active
-    }
-    asyncio.create_task(trigger_webhooks(EventType.product_created, product_data))
+    return db_product
+
+
+@router.post("", response_model=ProductResponse, status_code=201)
+async def create_product(product: ProductCreate, db: Session = Depends(get_db)):
+    """Create a new product"""
+    db_product = await run_db(insert_product, db, product)
+    product_counts.clear()
+    delivery_engine.notify()
     
     return db_product
 
 
-@router.put("/{product_id}", response_model=ProductResponse)
-async def update_product(
-    product_id: int,
-    product_update: ProductUpdate,
-    db: Session = Depends(get_db)
-):
-    """Update a product"""
+@router.post("/batch", response_model=BatchUpsertResponse)
+async def batch_upsert_products(request: Request, db: Session = Depends(get_db)):
+    """
+    Create or update many products in one request.
+    The body is a JSON array of products, or NDJSON (one product per line,
+    Content-Type: application/x-ndjson) which is processed as it streams in.
+    Existing SKUs (case-insensitive) are updated. Items are written in chunks,
+    each committed separately; invalid items are reported and skipped.
+    """
+    batch_id = create_job_id()
+    writer = BatchWriter(db, batch_id)
+    
+    if is_ndjson(request.headers.get("content-type")):
+        async for line in iter_ndjson_lines(request.stream()):
+            if writer.count >= BATCH_MAX_ITEMS:
+                await run_db(writer.finish)
+                product_counts.clear()
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Batch exceeds {BATCH_MAX_ITEMS} items; the first {BATCH_MAX_ITEMS} were processed"
+                )
+            if writer.add(line):
+                await run_db(writer.write)
+    else:
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of products")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of products")
+        if len(items) > BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+        for item in items:
+            if writer.add(item):
+                await run_db(writer.write)
+    
+    summary = await run_db(writer.finish)
+    if summary["created"] or summary["updated"]:
+        product_counts.clear()
+    
+    return BatchUpsertResponse(batch_id=batch_id, **summary)
+
+
+def apply_product_update(db: Session, product_id: int, product_update: ProductUpdate) -> Product:
+    """Update a product and queue its webhooks in one transaction"""
+    SQLITE_LOCK_WAIT.observe(begin_immediate(db), "crud")
     db_product = db.query(Product).filter(Product.id == product_id).first()
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
     # Check SKU uniqueness if updating SKU
-    if product_update.sku and product_update.sku.lower() != db_product.sku.lower():
+    if product_update.sku and normalize_sku(product_update.sku) != db_product.sku_normalized:
         existing = db.query(Product).filter(
-            func.lower(Product.sku) == product_update.sku.lower(),
+            Product.sku_normalized == normalize_sku(product_update.sku),
             Product.id != product_id
         ).first()
         if existing:
@@ -118,55 +280,74 @@ async def update_product(
             )
     
     # Update fields
+    was_active = bool(db_product.active)
     update_data = product_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(db_product, field, value)
     
+    # Queue webhooks in the same transaction
+    enqueue_webhooks(db, EventType.product_updated, product_payload(db_product))
+    bump_counter(db, CATALOGUE_GENERATION)
+    adjust_stats(db, active=bool(db_product.active) - was_active)
     db.commit()
     db.refresh(db_product)
-    
-    # Trigger webhook asynchronously
-    product_data = {
-        "id": db_product.id,
-        "sku": db_product.sku,
-        "name": db_product.name,
-        "description": db_product.description,
-        "active": db_product.active
-    }
-    asyncio.create_task(trigger_webhooks(EventType.product_updated, product_data))
+    return db_product
+
+
+@router.put("/{product_id}", response_model=ProductResponse)
+async def update_product(
+    product_id: int,
+    product_update: ProductUpdate,
+    db: Session = Depends(get_db)
+):
+    """Update a product"""
+    db_product = await run_db(apply_product_update, db, product_id, product_update)
+    product_counts.clear()
+    delivery_engine.notify()
     
     return db_product
 
 
-@router.delete("/bulk", status_code=204)
-def bulk_delete_products(db: Session = Depends(get_db)):
-    """Delete all products"""
-    db.query(Product).delete()
-    db.commit()
-    return None
+@router.delete("/bulk", response_model=BulkDeleteResponse, status_code=202)
+def bulk_delete_products(background_tasks: BackgroundTasks):
+    """
+    Delete all products.
+    The table is swapped for an empty one immediately; disk space is
+    reclaimed in the background and reported through the job progress stream.
+    """
+    job_id = create_job_id()
+    create_job(job_id, status="reclaiming", message="Deleting products...")
+    try:
+        suffix = swap_out_products()
+    except Exception as e:
+        update_job(job_id, status="error", message=f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error deleting products: {str(e)}")
+    product_counts.clear()
+    
+    background_tasks.add_task(reclaim_trash, suffix, job_id)
+    return BulkDeleteResponse(job_id=job_id, message="All products deleted")
 
 
-@router.delete("/{product_id}", status_code=204)
-async def delete_product(product_id: int, db: Session = Depends(get_db)):
-    """Delete a product"""
+def remove_product(db: Session, product_id: int) -> None:
+    """Delete a product and queue its webhooks in one transaction"""
+    SQLITE_LOCK_WAIT.observe(begin_immediate(db), "crud")
     db_product = db.query(Product).filter(Product.id == product_id).first()
     if not db_product:
         raise HTTPException(status_code=404, detail="Product not found")
     
-    # Store product data for webhook before deletion
-    product_data = {
-        "id": db_product.id,
-        "sku": db_product.sku,
-        "name": db_product.name,
-        "description": db_product.description,
-        "active": db_product.active
-    }
-    
+    # Queue webhooks with the product data captured before deletion
+    enqueue_webhooks(db, EventType.product_deleted, product_payload(db_product))
     db.delete(db_product)
+    bump_counter(db, CATALOGUE_GENERATION)
+    adjust_stats(db, total=-1, active=-int(bool(db_product.active)))
     db.commit()
-    
-    # Trigger webhook asynchronously
-    asyncio.create_task(trigger_webhooks(EventType.product_deleted, product_data))
+
+
+@router.delete("/{product_id}", status_code=204)
+async def delete_product(product_id: int, db: Session = Depends(get_db)):
+    """Delete a product"""
+    await run_db(remove_product, db, product_id)
+    product_counts.clear()
+    delivery_engine.notify()
     
     return None
-
@@ -1,63 +1,258 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Header, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from ..database import get_db, SessionLocal
-from ..schemas import UploadResponse, ProgressResponse
-from ..services.csv_processor import process_csv_file, get_progress, create_job_id
+from ..database import run_db
+from ..schemas import (
+    UploadResponse, ProgressResponse, ImportQueueResponse, UploadSessionCreate, UploadSessionResponse
+)
+from ..services.csv_parsing import ACCEPTED_EXTENSIONS, is_accepted_filename
+from ..services.import_scheduler import import_scheduler
+from ..services.progress_bus import progress_bus
+from ..services.job_store import TERMINAL_STATUSES, create_job, create_job_id, get_job, request_cancel
+from ..services.upload_sessions import (
+    UPLOAD_MAX_CHUNK_BYTES, ChunkInterrupted, OffsetMismatch, abort_session, acknowledge, create_session,
+    finalize_session, get_session, parse_content_range, write_chunk
+)
 import asyncio
+import hashlib
 import json
+import os
+import tempfile
+import time
+from typing import Optional, Tuple
 
 router = APIRouter()
 
+CSV_FILE_REQUIRED = f"File must be a CSV file ({', '.join(ACCEPTED_EXTENSIONS)})"
 
-def process_csv_in_thread(content: bytes, job_id: str):
-    """Process CSV in a separate thread with its own database session"""
-    db = SessionLocal()
+# Uploads are copied to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Idle progress streams send a comment this often to stay open
+PROGRESS_HEARTBEAT_SECONDS = float(os.getenv("PROGRESS_HEARTBEAT_SECONDS", "15"))
+# How often progress of jobs running in other workers is read from the job store
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", "0.5"))
+
+
+async def spool_upload(file: UploadFile) -> Tuple[str, str]:
+    """
+    Copy the upload to a temporary file on disk without holding it in memory.
+    Returns the path and the sha256 of the content, computed on the way.
+    Writing and hashing run in a thread so the event loop is never blocked.
+    """
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=".csv")
+    digest = hashlib.sha256()
     try:
-        process_csv_file(content, db, job_id)
-    finally:
-        db.close()
+        with os.fdopen(fd, "wb") as spool:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await asyncio.to_thread(_spool_block, spool, digest, chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def _spool_block(spool, digest, chunk: bytes) -> None:
+    spool.write(chunk)
+    digest.update(chunk)
 
 
 @router.post("", response_model=UploadResponse)
 async def upload_csv(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    workers: Optional[int] = Query(None, ge=0, le=64, description="Parser processes for large files (0/1 = serial)"),
+    priority: int = Query(0, ge=-10, le=10, description="Queued imports with a higher priority start first"),
+    force: bool = Query(False, description="Import even if this exact file was already imported")
 ):
-    """Upload and process CSV file"""
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="File must be a CSV file")
+    """Upload and process a CSV file, optionally gzip/bz2/xz compressed or in a single-file zip"""
+    if not is_accepted_filename(file.filename):
+        raise HTTPException(status_code=400, detail=CSV_FILE_REQUIRED)
     
-    # Read file content
-    content = await file.read()
+    # Spool file to disk
+    file_path, checksum = await spool_upload(file)
     
-    # Create job ID
+    # Create job ID and record the job before work starts so any worker can report it
     job_id = create_job_id()
-    
-    # Process file in background thread
+    await run_db(create_job, job_id, "queued", "Queued")
+    return await queue_import(job_id, file_path, checksum, workers, priority, force)
+
+
+async def queue_import(
+    job_id: str,
+    file_path: str,
+    checksum: str,
+    workers: Optional[int],
+    priority: int,
+    force: bool
+) -> UploadResponse:
+    """Hand a spooled file to the scheduler; it bounds how many imports run at once"""
     try:
-        # Run in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        loop.run_in_executor(
-            None,
-            process_csv_in_thread,
-            content,
-            job_id
-        )
+        position = await run_db(import_scheduler.submit, job_id, file_path, workers, priority, force, checksum)
     except Exception as e:
+        os.remove(file_path)
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
     
-    return UploadResponse(job_id=job_id, message="File upload started")
+    message = f"File upload queued (position {position})" if position else "File upload started"
+    return UploadResponse(job_id=job_id, message=message)
+
+
+@router.post("/sessions", response_model=UploadSessionResponse, status_code=201)
+async def create_upload_session(upload: UploadSessionCreate):
+    """Start a resumable upload; send the file with PUT /sessions/{upload_id} in byte ranges"""
+    if not is_accepted_filename(upload.filename):
+        raise HTTPException(status_code=400, detail=CSV_FILE_REQUIRED)
+    return await run_db(create_session, upload.filename, upload.size)
+
+
+@router.get("/sessions/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(upload_id: str):
+    """Session state; `offset` is where an interrupted upload continues"""
+    session = await run_db(get_session, upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+@router.put("/sessions/{upload_id}", response_model=UploadSessionResponse)
+async def upload_chunk(upload_id: str, request: Request, content_range: str = Header(...)):
+    """
+    Append the byte range given by Content-Range ('bytes start-end/total').
+    The range must start at the session's offset; otherwise 409 reports the offset to resume from.
+    """
+    try:
+        start, end, total = parse_content_range(content_range)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if end - start > UPLOAD_MAX_CHUNK_BYTES:
+        raise HTTPException(status_code=413, detail=f"Chunks are limited to {UPLOAD_MAX_CHUNK_BYTES} bytes")
+    
+    session = await run_db(get_session, upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session["status"] != "open":
+        raise HTTPException(status_code=409, detail=f"Upload session already {session['status']}")
+    if total is not None and session["size"] is not None and total != session["size"]:
+        raise HTTPException(status_code=400, detail=f"Upload size is {session['size']} bytes")
+    if start != session["offset"]:
+        raise HTTPException(status_code=409, detail={"message": "Range does not start at the offset", "offset": session["offset"]})
+    
+    error = None
+    try:
+        written = await write_chunk(upload_id, start, end, request.stream())
+    except ChunkInterrupted as e:
+        written, error = e.written, e.error
+    
+    # Acknowledge whatever reached the disk, even if the client went away mid-chunk
+    if written:
+        try:
+            session = await run_db(acknowledge, upload_id, start, start + written)
+        except OffsetMismatch as e:
+            if error is None:
+                raise HTTPException(status_code=409, detail={"message": "Range was uploaded concurrently", "offset": e.offset})
+    
+    if isinstance(error, ValueError):
+        raise HTTPException(status_code=400, detail={"message": str(error), "offset": start + written})
+    if error is not None:
+        raise error
+    if written != end - start:
+        raise HTTPException(status_code=400, detail={"message": "Body is shorter than the Content-Range", "offset": start + written})
+    return session
+
+
+@router.post("/sessions/{upload_id}/finalize", response_model=UploadResponse)
+async def finalize_upload(
+    upload_id: str,
+    workers: Optional[int] = Query(None, ge=0, le=64, description="Parser processes for large files (0/1 = serial)"),
+    priority: int = Query(0, ge=-10, le=10, description="Queued imports with a higher priority start first"),
+    force: bool = Query(False, description="Import even if this exact file was already imported")
+):
+    """Finish a chunked upload and queue its import"""
+    job_id = create_job_id()
+    spooled = await run_db(finalize_session, upload_id, job_id)
+    if spooled is None:
+        session = await run_db(get_session, upload_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        if session["status"] != "open":
+            raise HTTPException(status_code=409, detail=f"Upload session already {session['status']}")
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "offset": session["offset"]})
+    
+    file_path, checksum = spooled
+    await run_db(create_job, job_id, "queued", "Queued")
+    return await queue_import(job_id, file_path, checksum, workers, priority, force)
+
+
+@router.delete("/sessions/{upload_id}", status_code=204)
+async def abort_upload(upload_id: str):
+    """Abandon an unfinished upload and delete what was received"""
+    if not await run_db(abort_session, upload_id):
+        raise HTTPException(status_code=404, detail="Open upload session not found")
+
+
+@router.get("/queue", response_model=ImportQueueResponse)
+def get_import_queue():
+    """Imports running and waiting in this worker"""
+    return import_scheduler.snapshot()
+
+
+@router.post("/{job_id}/cancel", response_model=ProgressResponse)
+async def cancel_import(job_id: str):
+    """
+    Cancel an import. Queued imports are dropped; running imports stop at the
+    next batch boundary, keeping the batches already committed.
+    """
+    status = await run_db(request_cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if status in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {status}")
+    
+    await run_db(import_scheduler.cancel, job_id)
+    job = await run_db(get_job, job_id)
+    return ProgressResponse(job_id=job_id, **job)
+
+
+async def poll_job(job_id: str, after_revision: int, timeout: float) -> Optional[Tuple[int, Optional[dict]]]:
+    """
+    Wait for a job published by another worker by polling the job store.
+    Same contract as progress_bus.wait(); a missing job returns (0, None).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await run_db(get_job, job_id)
+        if job is None:
+            return 0, None
+        if job["revision"] > after_revision or job["status"] in TERMINAL_STATUSES:
+            return job["revision"], job
+        if time.monotonic() >= deadline:
+            return None
+        await asyncio.sleep(PROGRESS_POLL_INTERVAL)
 
 
 @router.get("/progress/{job_id}")
-async def get_upload_progress(job_id: str):
-    """SSE endpoint for upload progress"""
+async def get_upload_progress(job_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    SSE endpoint for upload progress.
+    Jobs running in this worker are pushed as they change; others are polled.
+    Reconnecting clients resume after the Last-Event-ID they received.
+    """
+    try:
+        after_revision = int(last_event_id) if last_event_id else 0
+    except ValueError:
+        after_revision = 0
     
     async def event_generator():
+        revision = after_revision
         while True:
-            progress_data = get_progress(job_id)
+            if progress_bus.tracks(job_id):
+                update = await progress_bus.wait(job_id, revision, PROGRESS_HEARTBEAT_SECONDS)
+            else:
+                update = await poll_job(job_id, revision, PROGRESS_HEARTBEAT_SECONDS)
             
+            if update is None:
+                # Nothing changed; keep proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            
+            revision, progress_data = update
             if not progress_data:
                 yield f"data: {json.dumps({'error': 'Job not found'})}\n\n"
                 break
@@ -68,16 +263,18 @@ async def get_upload_progress(job_id: str):
                 progress=progress_data["progress"],
                 message=progress_data["message"],
                 total_records=progress_data.get("total_records"),
-                processed_records=progress_data.get("processed_records")
+                processed_records=progress_data.get("processed_records"),
+                inserted_records=progress_data.get("inserted_records"),
+                updated_records=progress_data.get("updated_records"),
+                unchanged_records=progress_data.get("unchanged_records"),
+                skipped_records=progress_data.get("skipped_records")
             )
             
-            yield f"data: {json.dumps(response.dict())}\n\n"
+            yield f"id: {revision}\ndata: {json.dumps(response.dict())}\n\n"
             
-            # Stop if complete or error
-            if progress_data["status"] in ["complete", "error"]:
+            # Stop once the job has finished, failed or been cancelled
+            if progress_data["status"] in TERMINAL_STATUSES:
                 break
-            
-            await asyncio.sleep(0.5)  # Update every 500ms
     
     return StreamingResponse(
         event_generator(),
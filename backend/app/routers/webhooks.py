@@ -1,10 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
-from ..database import get_db
+from ..database import get_db, run_db
 from ..models import Webhook
 from ..schemas import WebhookCreate, WebhookUpdate, WebhookResponse, WebhookTestResponse
-from ..services.webhook_service import test_webhook
+from ..services.counters import WEBHOOKS_VERSION, bump_counter
+from ..services.webhook_service import subscriptions, test_webhook
 
 router = APIRouter()
 
@@ -21,7 +22,9 @@ def create_webhook(webhook: WebhookCreate, db: Session = Depends(get_db)):
     """Create a new webhook"""
     db_webhook = Webhook(**webhook.dict())
     db.add(db_webhook)
+    bump_counter(db, WEBHOOKS_VERSION)
     db.commit()
+    subscriptions.invalidate()
     db.refresh(db_webhook)
     return db_webhook
 
@@ -41,7 +44,9 @@ def update_webhook(
     for field, value in update_data.items():
         setattr(db_webhook, field, value)
     
+    bump_counter(db, WEBHOOKS_VERSION)
     db.commit()
+    subscriptions.invalidate()
     db.refresh(db_webhook)
     return db_webhook
 
@@ -54,14 +59,16 @@ def delete_webhook(webhook_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Webhook not found")
     
     db.delete(db_webhook)
+    bump_counter(db, WEBHOOKS_VERSION)
     db.commit()
+    subscriptions.invalidate()
     return None
 
 
 @router.post("/{webhook_id}/test", response_model=WebhookTestResponse)
 async def test_webhook_endpoint(webhook_id: int, db: Session = Depends(get_db)):
     """Test a webhook"""
-    db_webhook = db.query(Webhook).filter(Webhook.id == webhook_id).first()
+    db_webhook = await run_db(db.get, Webhook, webhook_id)
     if not db_webhook:
         raise HTTPException(status_code=404, detail="Webhook not found")
     
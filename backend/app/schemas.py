@@ -33,10 +33,34 @@ class ProductResponse(ProductBase):
 
 class ProductListResponse(BaseModel):
     items: list[ProductResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
+class ProductStatsResponse(BaseModel):
+    total: int
+    active: int
+    inactive: int
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    sku: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+
+
+class BatchUpsertResponse(BaseModel):
+    batch_id: str
+    created: int
+    updated: int
+    unchanged: int
+    duplicates: int
+    failed: int
+    items: list[BatchItemResult]
 
 
 class WebhookBase(BaseModel):
@@ -68,6 +92,26 @@ class UploadResponse(BaseModel):
     message: str
 
 
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: Optional[int] = Field(None, ge=0)
+
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    filename: str
+    size: Optional[int] = None
+    offset: int
+    status: str
+    job_id: Optional[str] = None
+    chunk_size: int
+
+
+class BulkDeleteResponse(BaseModel):
+    job_id: str
+    message: str
+
+
 class ProgressResponse(BaseModel):
     job_id: str
     status: str
@@ -75,6 +119,22 @@ class ProgressResponse(BaseModel):
     message: str
     total_records: Optional[int] = None
     processed_records: Optional[int] = None
+    inserted_records: Optional[int] = None
+    updated_records: Optional[int] = None
+    unchanged_records: Optional[int] = None
+    skipped_records: Optional[int] = None
+
+
+class QueuedImport(BaseModel):
+    job_id: str
+    priority: int
+    position: int
+
+
+class ImportQueueResponse(BaseModel):
+    concurrency: int
+    running: list[str]
+    queued: list[QueuedImport]
 
 
 class WebhookTestResponse(BaseModel):
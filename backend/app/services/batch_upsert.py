@@ -0,0 +1,146 @@
+"""
+Batch product writes for POST /api/products/batch.
+
+Items are validated one by one, collected into chunks and written with the
+same set-based upsert as CSV imports. Each chunk is committed on its own, so
+a large batch never holds the write lock for long; the per-item outcomes
+report what happened to every item.
+"""
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from ..database import begin_immediate
+from ..models import normalize_sku
+from ..schemas import ProductCreate
+from .counters import CATALOGUE_GENERATION, bump_counter
+from .metrics import SQLITE_LOCK_WAIT
+from .product_upsert import upsert_products
+from .webhook_service import WebhookBatcher, delivery_engine
+
+# Items upserted and committed per transaction
+BATCH_CHUNK_SIZE = int(os.getenv("PRODUCT_BATCH_CHUNK_SIZE", "1000"))
+# Maximum number of items accepted in one request
+BATCH_MAX_ITEMS = int(os.getenv("PRODUCT_BATCH_MAX_ITEMS", "100000"))
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a streamed body into non-blank lines without buffering it whole"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'item'}: {e['msg']}"
+        for e in error.errors()
+    )
+
+
+class BatchWriter:
+    """Validates items, upserts them in chunks and records per-item outcomes"""
+
+    def __init__(self, db: Session, batch_id: str, chunk_size: int = BATCH_CHUNK_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.webhooks = WebhookBatcher(batch_id)
+        self.results: List[Dict[str, Any]] = []
+        self._pending: List[Dict[str, Any]] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.results)
+
+    def add(self, raw: Any) -> bool:
+        """
+        Validate one item (a decoded object or a raw NDJSON line).
+        Returns True when a full chunk is waiting to be written.
+        """
+        result = {"index": len(self.results), "sku": None, "status": "error", "error": None}
+        self.results.append(result)
+        try:
+            if isinstance(raw, (bytes, str)):
+                raw = json.loads(raw)
+            product = ProductCreate.model_validate(raw)
+        except ValueError as e:
+            # json.JSONDecodeError and pydantic's ValidationError are both ValueErrors
+            result["error"] = _error_message(e) if isinstance(e, ValidationError) else f"Invalid JSON: {e}"
+            return False
+
+        result["sku"] = product.sku
+        if not product.sku.strip():
+            result["error"] = "sku: must not be empty"
+            return False
+
+        self._pending.append(result)
+        result["row"] = product.model_dump()
+        return len(self._pending) >= self.chunk_size
+
+    def write(self) -> None:
+        """Upsert and commit the pending chunk"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        webhooks = self.webhooks.snapshot()
+        try:
+            SQLITE_LOCK_WAIT.observe(begin_immediate(self.db), "batch")
+            written = upsert_products(self.db, [result["row"] for result in pending])
+            queued = self.webhooks.add(self.db, written)
+            if written["created"] or written["updated"]:
+                bump_counter(self.db, CATALOGUE_GENERATION)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            # Neither the failed rows nor batches queued in the rolled-back transaction were announced
+            self.webhooks.restore(webhooks)
+            for result in pending:
+                del result["row"]
+                result["error"] = f"Write failed: {str(e)}"
+            return
+
+        # Items repeating a SKU (in any case) within the chunk were merged into the last one
+        status = {row["sku_normalized"]: kind for kind, rows in written.items() for row in rows}
+        survivors = {}
+        for result in reversed(pending):
+            del result["row"]
+            key = normalize_sku(result["sku"])
+            if key in survivors:
+                result["status"] = "duplicate"
+                result["error"] = f"Superseded by item {survivors[key]} with the same SKU"
+            else:
+                survivors[key] = result["index"]
+                result["status"] = status[key]
+        if queued:
+            delivery_engine.notify()
+
+    def finish(self) -> Dict[str, Any]:
+        """Write the remaining items, flush webhook batches and summarise"""
+        self.write()
+        if self.webhooks.flush(self.db):
+            self.db.commit()
+            delivery_engine.notify()
+
+        totals = {"created": 0, "updated": 0, "unchanged": 0, "duplicate": 0, "error": 0}
+        for result in self.results:
+            totals[result["status"]] += 1
+        return {
+            "created": totals["created"],
+            "updated": totals["updated"],
+            "unchanged": totals["unchanged"],
+            "duplicates": totals["duplicate"],
+            "failed": totals["error"],
+            "items": self.results
+        }
+
+
+def is_ndjson(content_type: Optional[str]) -> bool:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return media_type in ("application/x-ndjson", "application/ndjson", "application/jsonlines")
@@ -0,0 +1,135 @@
+"""
+Instant "delete all products".
+
+On SQLite the products table (and its search index) is renamed to a trash
+table and an empty one is created in its place, all in one short
+transaction. The trash is then deleted in small chunks in the background so
+the write lock is only held briefly at a time, and finally dropped.
+"""
+import os
+import threading
+import time
+import uuid
+from typing import List, Optional
+from sqlalchemy import text
+from ..database import CATALOGUE_WRITE_LOCK, engine
+from ..models import Product
+from .catalogue_stats import reset_stats
+from .counters import CATALOGUE_GENERATION, bump_counter
+from .job_store import update_job
+from .metrics import SQLITE_LOCK_WAIT
+from .search_index import create_search_table, detach_search_table, resume_search_sync, suspend_search_sync
+
+TRASH_PREFIX = "products_trash_"
+SEARCH_TRASH_PREFIX = "products_fts_trash_"
+
+# Rows deleted per background transaction while reclaiming a trash table
+RECLAIM_CHUNK_ROWS = int(os.getenv("BULK_DELETE_CHUNK_ROWS", "5000"))
+
+
+def swap_out_products() -> Optional[str]:
+    """
+    Replace products with an empty table.
+    Returns the trash suffix to reclaim, or None when nothing is left to do.
+    """
+    with engine.connect() as conn:
+        if conn.dialect.name != "sqlite":
+            if conn.dialect.name == "postgresql":
+                conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({CATALOGUE_WRITE_LOCK})")
+            # Other databases truncate without visiting rows
+            conn.execute(text(f"TRUNCATE TABLE {Product.__tablename__}"))
+            bump_counter(conn, CATALOGUE_GENERATION)
+            reset_stats(conn)
+            conn.commit()
+            return None
+
+        suffix = uuid.uuid4().hex[:12]
+        trash = TRASH_PREFIX + suffix
+
+        # Take the write lock up front so the swap is a single atomic transaction
+        waiting = time.perf_counter()
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        SQLITE_LOCK_WAIT.observe(time.perf_counter() - waiting, "bulk_delete")
+        suspend_search_sync(conn)
+        detach_search_table(conn, SEARCH_TRASH_PREFIX + suffix)
+        conn.execute(text(f"ALTER TABLE products RENAME TO {trash}"))
+
+        # Index names stay with the renamed table; drop them so they can be recreated
+        for index in conn.execute(text(f"PRAGMA index_list('{trash}')")).mappings().all():
+            if index["origin"] == "c":
+                conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+
+        Product.__table__.create(conn)
+        create_search_table(conn)
+        resume_search_sync(conn, rebuild=False)
+        bump_counter(conn, CATALOGUE_GENERATION)
+        reset_stats(conn)
+        conn.commit()
+        return suffix
+
+
+def _trash_tables(suffix: Optional[str]) -> List[str]:
+    """Trash tables to reclaim: those of one swap, or every leftover one"""
+    pattern = suffix or "%"
+    with engine.connect() as conn:
+        tables = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND ("
+            "name LIKE :trash ESCAPE '\\' OR "
+            "(name LIKE :search_trash ESCAPE '\\' AND sql LIKE 'CREATE VIRTUAL TABLE%'))"
+        ), {
+            "trash": TRASH_PREFIX.replace("_", "\\_") + pattern,
+            "search_trash": SEARCH_TRASH_PREFIX.replace("_", "\\_") + pattern
+        }).scalars().all()
+    # Plain trash tables first; they are the ones reclaimed in chunks
+    return sorted(tables, key=lambda name: name.startswith(SEARCH_TRASH_PREFIX))
+
+
+def _reclaim_table(table: str, job_id: Optional[str], stop: Optional[threading.Event]) -> bool:
+    """Delete and drop one trash table; returns False if stop was set before it was done"""
+    with engine.connect() as conn:
+        if not table.startswith(SEARCH_TRASH_PREFIX):
+            bounds = conn.execute(text(f"SELECT min(rowid), max(rowid) FROM {table}")).first()
+            conn.commit()
+            if bounds and bounds[0] is not None:
+                lowest, highest = bounds
+                upper = lowest
+                while upper <= highest:
+                    upper += RECLAIM_CHUNK_ROWS
+                    conn.execute(text(f"DELETE FROM {table} WHERE rowid < :upper"), {"upper": upper})
+                    conn.commit()
+                    if stop is not None and stop.is_set():
+                        return False
+                    if job_id:
+                        done = min(upper - lowest, highest - lowest + 1)
+                        update_job(
+                            job_id,
+                            progress=min(done / (highest - lowest + 1) * 100, 99.9),
+                            processed_records=done,
+                            message="Reclaiming space..."
+                        )
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        conn.commit()
+    return True
+
+
+def reclaim_trash(
+    suffix: Optional[str] = None,
+    job_id: Optional[str] = None,
+    stop: Optional[threading.Event] = None
+) -> None:
+    """
+    Delete trash tables left by swap_out_products() in small chunks and drop
+    them. Without a suffix every leftover trash table is reclaimed (startup).
+    Setting stop ends the work after the current chunk; what is left is
+    reclaimed at the next startup.
+    """
+    try:
+        for table in _trash_tables(suffix) if engine.dialect.name == "sqlite" else []:
+            if not _reclaim_table(table, job_id, stop):
+                return
+        if job_id:
+            update_job(job_id, status="complete", progress=100.0, message="All products deleted.")
+    except Exception as e:
+        if job_id:
+            update_job(job_id, status="error", message=f"Error: {str(e)}")
+        raise
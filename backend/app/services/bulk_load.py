@@ -0,0 +1,89 @@
+"""
+Bulk-load mode for large imports.
+
+While a large file is loaded, the products table only keeps the index the
+upsert itself needs (the unique sku_normalized index it conflicts on). The
+other secondary indexes are dropped and the search index triggers
+suspended; both are rebuilt in one pass at the end, which is much cheaper
+than maintaining them row by row. A WAL checkpoint afterwards folds the
+load into the database file so the log does not keep growing.
+
+The dropped indexes are declared on the Product model, so restore_indexes()
+can recreate them at startup if an import was interrupted mid-load.
+"""
+import os
+import time
+from typing import Dict, List, Optional
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from ..database import engine
+from ..models import Product
+from .metrics import IMPORT_PHASE_SECONDS
+from .search_index import SEARCH_REBUILD_MIN_BYTES, resume_search_sync, suspend_search_sync
+
+# Imports of files at least this large run in bulk-load mode
+BULK_LOAD_MIN_BYTES = int(os.getenv("BULK_LOAD_MIN_BYTES", str(SEARCH_REBUILD_MIN_BYTES)))
+# Checkpoint mode run after a bulk load (PASSIVE, FULL, RESTART or TRUNCATE; empty to skip)
+BULK_LOAD_CHECKPOINT = os.getenv("BULK_LOAD_CHECKPOINT", "TRUNCATE")
+
+# Needed by the upsert's ON CONFLICT target and SKU lookups, so never deferred
+_REQUIRED_INDEX_COLUMNS = {"sku_normalized"}
+
+
+def deferrable_indexes() -> List:
+    """Secondary indexes of the products table that a bulk load may drop"""
+    return sorted(
+        (index for index in Product.__table__.indexes
+         if not {column.name for column in index.columns} & _REQUIRED_INDEX_COLUMNS),
+        key=lambda index: index.name
+    )
+
+
+def use_bulk_load(total_bytes: int, bulk_load: Optional[bool] = None) -> bool:
+    """Whether an import of this size should defer index maintenance (None = decide by size)"""
+    if engine.dialect.name != "sqlite":
+        return False
+    return total_bytes >= BULK_LOAD_MIN_BYTES if bulk_load is None else bulk_load
+
+
+def begin_bulk_load(db: Session) -> None:
+    """Drop deferrable indexes and the search sync triggers (caller commits)"""
+    for index in deferrable_indexes():
+        index.drop(bind=db.connection(), checkfirst=True)
+    suspend_search_sync(db)
+
+
+def end_bulk_load(db: Session, rebuild_search: bool = True) -> None:
+    """Recreate the dropped indexes and search triggers, rebuilding the search index (caller commits)"""
+    started = time.perf_counter()
+    restore_indexes(db.connection())
+    resume_search_sync(db, rebuild=rebuild_search)
+    IMPORT_PHASE_SECONDS.inc(time.perf_counter() - started, "index")
+
+
+def restore_indexes(bind) -> None:
+    """Create any deferrable index that is missing (e.g. after an interrupted bulk load)"""
+    for index in deferrable_indexes():
+        index.create(bind=bind, checkfirst=True)
+
+
+def checkpoint_wal(bind: Optional[Engine] = None) -> Optional[Dict[str, int]]:
+    """
+    Copy the WAL back into the database file outside any transaction.
+    Returns SQLite's (busy, log, checkpointed) frame counts, or None when skipped.
+    Best effort: if another writer holds the database, SQLite's automatic
+    checkpoints catch up later.
+    """
+    bind = bind or engine
+    if bind.dialect.name != "sqlite" or not BULK_LOAD_CHECKPOINT:
+        return None
+    started = time.perf_counter()
+    try:
+        with bind.connect() as conn:
+            busy, log, checkpointed = conn.exec_driver_sql(f"PRAGMA wal_checkpoint({BULK_LOAD_CHECKPOINT})").one()
+    except OperationalError:
+        return None
+    finally:
+        IMPORT_PHASE_SECONDS.inc(time.perf_counter() - started, "checkpoint")
+    return {"busy": busy, "log": log, "checkpointed": checkpointed}
@@ -0,0 +1,76 @@
+"""
+Product counts maintained incrementally in the counters table.
+
+Every write path (CRUD, batch upserts, CSV imports and bulk delete) adjusts
+the counters in the same transaction as the rows it changes, so totals are
+read with one indexed lookup instead of a COUNT(*) over the catalogue.
+Databases created before the counters existed are counted once at startup.
+"""
+from typing import Dict, Union
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from ..models import Counter, Product
+from .counters import set_counter
+
+PRODUCTS_TOTAL = "products_total"
+PRODUCTS_ACTIVE = "products_active"
+STAT_COUNTERS = (PRODUCTS_TOTAL, PRODUCTS_ACTIVE)
+
+
+def adjust_stats(db: Union[Session, Connection], total: int = 0, active: int = 0) -> None:
+    """
+    Add deltas to the product counts inside the caller's transaction.
+    Before the startup count has run the counters do not exist yet and are
+    left alone; that count includes this write once it commits.
+    """
+    for name, delta in ((PRODUCTS_TOTAL, total), (PRODUCTS_ACTIVE, active)):
+        if delta:
+            db.execute(update(Counter).where(Counter.name == name).values(value=Counter.value + delta))
+
+
+def reset_stats(db: Union[Session, Connection]) -> None:
+    """Zero the product counts (the catalogue was emptied in this transaction)"""
+    for name in STAT_COUNTERS:
+        set_counter(db, name, 0)
+
+
+def _count_products(db: Union[Session, Connection]) -> Dict[str, int]:
+    total, active = db.execute(
+        select(func.count(), func.count().filter(Product.active.is_(True))).select_from(Product)
+    ).one()
+    return {PRODUCTS_TOTAL: total, PRODUCTS_ACTIVE: active or 0}
+
+
+def get_stats(db: Session) -> Dict[str, int]:
+    """Total, active and inactive product counts"""
+    values = dict(db.execute(select(Counter.name, Counter.value).where(Counter.name.in_(STAT_COUNTERS))).all())
+    if len(values) < len(STAT_COUNTERS):
+        # Not initialized yet (startup still running); count directly
+        values = _count_products(db)
+    total, active = values[PRODUCTS_TOTAL], values[PRODUCTS_ACTIVE]
+    return {"total": total, "active": active, "inactive": total - active}
+
+
+def initialize_stats(bind: Engine) -> bool:
+    """
+    Count the catalogue once if the counters are missing (new or upgraded
+    databases). On SQLite and PostgreSQL writers are held off while counting,
+    so no change is lost between the count and the counters appearing.
+    Returns True if it counted.
+    """
+    with bind.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        elif conn.dialect.name == "postgresql":
+            conn.exec_driver_sql(f"LOCK TABLE {Product.__tablename__} IN SHARE MODE")
+        present = conn.execute(
+            select(func.count()).select_from(Counter).where(Counter.name.in_(STAT_COUNTERS))
+        ).scalar()
+        if present == len(STAT_COUNTERS):
+            conn.rollback()
+            return False
+        for name, value in _count_products(conn).items():
+            set_counter(conn, name, value)
+        conn.commit()
+        return True
@@ -0,0 +1,48 @@
+import sqlite3
+from typing import Union
+from sqlalchemy import insert, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from ..models import Counter
+
+# Bumped whenever webhook subscriptions change
+WEBHOOKS_VERSION = "webhooks_version"
+# Bumped by every transaction that changes products
+CATALOGUE_GENERATION = "catalogue_generation"
+
+
+def get_counter(db: Session, name: str) -> int:
+    """Current value of a counter (0 if it was never bumped)"""
+    value = db.query(Counter.value).filter(Counter.name == name).scalar()
+    return value or 0
+
+
+# Dialects with INSERT ... ON CONFLICT DO UPDATE (SQLite 3.24+)
+_UPSERTS = {"postgresql": postgresql_insert}
+if sqlite3.sqlite_version_info >= (3, 24, 0):
+    _UPSERTS["sqlite"] = sqlite_insert
+
+
+def _write_counter(db: Union[Session, Connection], name: str, initial: int, value) -> None:
+    """Insert the counter with `initial`, or set it to `value` if it exists, in one statement"""
+    dialect = (db.get_bind() if isinstance(db, Session) else db).dialect.name
+    upsert = _UPSERTS.get(dialect)
+    if upsert is None:
+        # Portable fallback; racing first writers can conflict on the primary key
+        if not db.execute(update(Counter).where(Counter.name == name).values(value=value)).rowcount:
+            db.execute(insert(Counter).values(name=name, value=initial))
+        return
+    stmt = upsert(Counter).values(name=name, value=initial)
+    db.execute(stmt.on_conflict_do_update(index_elements=[Counter.name], set_={"value": value}))
+
+
+def bump_counter(db: Union[Session, Connection], name: str, delta: int = 1) -> None:
+    """Add delta to a counter inside the caller's transaction (session or connection)"""
+    _write_counter(db, name, delta, Counter.value + delta)
+
+
+def set_counter(db: Union[Session, Connection], name: str, value: int) -> None:
+    """Set a counter inside the caller's transaction (session or connection)"""
+    _write_counter(db, name, value, value)
@@ -0,0 +1,268 @@
+"""
+CSV parsing helpers shared by the serial importer and the process-pool workers.
+Only depends on the standard library so worker processes start quickly.
+"""
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import re
+import zipfile
+from contextlib import contextmanager
+from itertools import islice
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+REQUIRED_COLUMNS = {'sku', 'name'}
+
+# Upload names accepted by the API; the compression itself is detected from the content
+ACCEPTED_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.zip')
+
+# Leading bytes of the supported compressed formats
+MAGIC_NUMBERS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'PK\x03\x04', 'zip'),
+)
+
+# Bytes read at a time when scanning for record boundaries
+SCAN_BLOCK_SIZE = 1024 * 1024
+
+# Text up to and including the next quote that is not inside a quoted field.
+# A quote at the start of a field opens one, which runs to its closing quote
+# ("" is an escaped quote); elsewhere a quote is plain text. The lookahead and
+# backreference make the quoted part atomic, and a closing quote must be
+# followed by a byte that is not a quote, so a match never depends on text
+# beyond the end of the buffer or endpos.
+_QUOTE_RUN_PATTERN = rb'[^"]*+(?:(?<=[,\n])"(?=((?:[^"]|"")*+))\1"(?=[^"])|(?<![,\n])")'
+_QUOTE_RUN = re.compile(_QUOTE_RUN_PATTERN)
+_QUOTE_RUNS = re.compile(rb'(?:' + _QUOTE_RUN_PATTERN + rb')*')
+
+# Appended to a parsed range: it comes back as a record of its own only when
+# the range ended outside a quoted field, i.e. on a real record boundary
+RANGE_END_FIELD = '\x00\x00'
+
+# A parsed row: (sku, name, description)
+Row = Tuple[str, str, Optional[str]]
+
+
+def is_accepted_filename(filename: Optional[str]) -> bool:
+    return bool(filename) and filename.lower().endswith(ACCEPTED_EXTENSIONS)
+
+
+def detect_compression(file_path: str) -> Optional[str]:
+    """Name of the compression format of a file from its magic bytes, or None for plain text"""
+    with open(file_path, 'rb') as f:
+        head = f.read(8)
+    return next((name for magic, name in MAGIC_NUMBERS if head.startswith(magic)), None)
+
+
+@contextmanager
+def open_csv_bytes(file_path: str) -> Iterator[Tuple[BinaryIO, BinaryIO]]:
+    """
+    Open a possibly compressed CSV file.
+    Yields (data, raw): the decompressed byte stream, inflated as it is read,
+    and the underlying file, whose tell() is the position in the stored bytes.
+    """
+    compression = detect_compression(file_path)
+    with open(file_path, 'rb') as raw:
+        if compression is None:
+            yield raw, raw
+        elif compression == 'zip':
+            with zipfile.ZipFile(raw) as archive:
+                members = [info for info in archive.infolist() if not info.is_dir()]
+                if len(members) != 1:
+                    raise ValueError("ZIP archive must contain exactly one CSV file")
+                with archive.open(members[0]) as data:
+                    yield data, raw
+        else:
+            if compression == 'gzip':
+                data = gzip.GzipFile(fileobj=raw, mode='rb')
+            else:
+                data = (bz2.BZ2File if compression == 'bz2' else lzma.LZMAFile)(raw, 'rb')
+            with data:
+                yield data, raw
+
+
+def iter_record_boundaries(file_path: str, start: int, step: int) -> Iterator[int]:
+    """
+    Yield byte offsets, beginning with start, where CSV records begin roughly
+    every step bytes, and finally the end of the file. Quotes are followed as
+    the csv module reads them, so an offset is only placed after a newline
+    outside a quoted field; a quote in the middle of an unquoted field
+    (12" pizza) is plain text. Offsets are produced as the file is scanned.
+    """
+    yield start
+    last = start
+    target = start + step
+
+    with open_csv_bytes(file_path) as (f, _):
+        f.seek(start)
+        # buffer[pos - 1] is kept for the field-start test; start itself begins a record
+        buffer, base, pos = b'\n', start - 1, 1
+        while True:
+            block = f.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            buffer = buffer[pos - 1:] + block
+            base += pos - 1
+            pos = 1
+
+            while True:
+                # Skip the quoted fields and stray quotes that end before the target
+                pos = _QUOTE_RUNS.match(buffer, pos, max(target - base, pos)).end()
+                newline = buffer.find(b'\n', max(pos, target - base - 1))
+                quote = buffer.find(b'"', pos, len(buffer) if newline == -1 else newline)
+                if quote == -1:
+                    if newline == -1:
+                        # Plain text up to the end of the block
+                        pos = len(buffer)
+                        break
+                    pos = newline + 1
+                    last = base + pos
+                    yield last
+                    target = last + step
+                    continue
+
+                run = _QUOTE_RUN.match(buffer, pos)
+                if run is None:
+                    # The quoted field goes on in the next block
+                    break
+                pos = run.end()
+
+    end = base + len(buffer)
+    if last != end:
+        yield end
+
+
+def find_record_boundaries(file_path: str, start: int, step: int, limit: Optional[int] = None) -> List[int]:
+    """
+    Return the offsets of iter_record_boundaries as a list; the scan stops
+    early after limit boundaries past start.
+    """
+    boundaries = iter_record_boundaries(file_path, start, step)
+    return list(boundaries if limit is None else islice(boundaries, limit + 1))
+
+
+def column_index(fieldnames: Optional[List[str]]) -> Dict[str, Optional[int]]:
+    """Map the required/optional columns to their positions in a header row"""
+    if not REQUIRED_COLUMNS.issubset(set(fieldnames or [])):
+        raise ValueError(f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}")
+
+    # Like csv.DictReader, a repeated column name refers to its last occurrence
+    positions = {name: i for i, name in enumerate(fieldnames)}
+    return {
+        'sku': positions['sku'],
+        'name': positions['name'],
+        'description': positions.get('description')
+    }
+
+
+def read_header(file_path: str) -> Tuple[Dict[str, Optional[int]], int]:
+    """
+    Parse the header record.
+    Returns the column index and the (decompressed) byte offset where the data records start.
+    """
+    boundaries = find_record_boundaries(file_path, 0, 1, limit=1)
+    data_start = boundaries[1] if len(boundaries) > 1 else 0
+
+    with open_csv_bytes(file_path) as (f, _):
+        header_text = f.read(data_start).decode('utf-8')
+    fieldnames = next(csv.reader(io.StringIO(header_text, newline='')), None)
+    return column_index(fieldnames), data_start
+
+
+def clean_record(record: List[str], index: Dict[str, Optional[int]]) -> Optional[Row]:
+    """Strip and validate one CSV record. Returns None for rows that should be skipped."""
+    width = len(record)
+    sku_pos, name_pos, description_pos = index['sku'], index['name'], index['description']
+
+    sku = record[sku_pos].strip() if sku_pos < width else ''
+    name = record[name_pos].strip() if name_pos < width else ''
+    if not sku or not name:
+        return None
+
+    description = record[description_pos] if description_pos is not None and description_pos < width else None
+    return sku, name, description.strip() if description else None
+
+
+def clean_records(
+    records: Iterable[List[str]],
+    index: Dict[str, Optional[int]],
+    counts: Optional[Dict[str, int]] = None
+) -> Iterator[Row]:
+    """Yield cleaned rows from parsed CSV records, skipping invalid ones (tallied in counts["invalid"])"""
+    for record in records:
+        row = clean_record(record, index)
+        if row is not None:
+            yield row
+        elif counts is not None:
+            counts["invalid"] = counts.get("invalid", 0) + 1
+
+
+def parse_records(
+    lines: Iterable[str],
+    index: Dict[str, Optional[int]],
+    counts: Optional[Dict[str, int]] = None
+) -> Iterator[Row]:
+    """Yield cleaned rows from CSV text, skipping invalid ones (tallied in counts["invalid"])"""
+    return clean_records(csv.reader(lines), index, counts)
+
+
+def iter_record_batches(
+    file_path: str,
+    index: Dict[str, Optional[int]],
+    data_start: int,
+    batch_size: int
+) -> Iterator[Tuple[List[Row], int, int]]:
+    """
+    Parse the file from data_start in this thread, yielding (rows, byte_offset, invalid_records) batches.
+    Compressed files are inflated as they are read; byte_offset is the
+    position in the stored (compressed) file, so progress stays meaningful.
+    """
+    with open_csv_bytes(file_path) as (data, raw_file):
+        data.seek(data_start)
+        # Decode incrementally; newline='' lets the csv module handle quoted newlines
+        file_io = io.TextIOWrapper(data, encoding='utf-8', newline='')
+
+        counts = {"invalid": 0}
+        reported = 0
+        batch = []
+        for row in parse_records(file_io, index, counts):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch, raw_file.tell(), counts["invalid"] - reported
+                reported = counts["invalid"]
+                batch = []
+
+        if batch or counts["invalid"] > reported:
+            yield batch, raw_file.tell(), counts["invalid"] - reported
+
+
+def parse_range(
+    file_path: str,
+    start: int,
+    end: int,
+    index: Dict[str, Optional[int]]
+) -> Tuple[List[Row], int, bool]:
+    """
+    Parse the records stored in bytes [start, end) of the file.
+    Runs in worker processes; start must be a record boundary.
+    Returns the rows, the number of invalid records skipped and whether the
+    range ended on a record boundary. When it did not, the last record was
+    cut short and the caller has to parse from start serially instead.
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+    if not text.endswith('\n'):
+        # Last range of a file without a final newline
+        text += '\n'
+    records = list(csv.reader(io.StringIO(text + RANGE_END_FIELD + '\n', newline='')))
+    complete = records[-1] == [RANGE_END_FIELD]
+    if complete:
+        records.pop()
+    counts = {"invalid": 0}
+    rows = list(clean_records(records, index, counts))
+    return rows, counts["invalid"], complete
@@ -1,133 +1,219 @@
-import csv
-import io
-import uuid
+import os
+import time
 from typing import Dict, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..models import Product
+from ..database import begin_immediate
+from .bulk_load import begin_bulk_load, checkpoint_wal, end_bulk_load, use_bulk_load
+from .counters import CATALOGUE_GENERATION, bump_counter, get_counter
+from .csv_parsing import iter_record_batches, read_header
+from .import_history import file_checksum, find_current_import, record_import
+from .metrics import IMPORT_PHASE_SECONDS, IMPORT_ROWS, IMPORT_ROWS_PER_SECOND, SQLITE_LOCK_WAIT
+from .job_store import ImportCancelled, cancel_requested, update_job
+from .parallel_import import iter_parallel_batches, use_parallel
+from .product_upsert import upsert_products
+from .webhook_service import WebhookBatcher, delivery_engine
 
-# In-memory progress tracking
-progress_tracker: Dict[str, Dict] = {}
 
+# Rows upserted and committed per transaction
+BATCH_SIZE = 1000
 
-def process_csv_file(file_content: bytes, db: Session, job_id: str) -> None:
+
+def _stats_message(stats: Dict[str, int]) -> str:
+    return (
+        f"{stats['inserted']} inserted, {stats['updated']} updated, "
+        f"{stats['unchanged']} unchanged, {stats['skipped']} skipped"
+    )
+
+
+def _announce_committed(db: Session, webhooks: Optional[WebhookBatcher], committed) -> None:
+    """
+    After a rollback, queue the webhook batches of the rows committed so far
+    in a transaction of their own; rows of the failed batch are forgotten.
+    """
+    if webhooks is None:
+        return
+    webhooks.restore(committed)
+    if webhooks.flush(db):
+        db.commit()
+        delivery_engine.notify()
+
+
+def process_csv_file(
+    file_path: str,
+    db: Session,
+    job_id: str,
+    workers: Optional[int] = None,
+    force: bool = False,
+    bulk_load: Optional[bool] = None,
+    checksum: Optional[str] = None
+) -> None:
     """
     Process CSV file and import products into database.
-    Uses streaming parser and batch inserts for performance.
+    Streams the file in a single pass and uses set-based upserts keyed on
+    the normalized SKU. gzip, bz2, xz and single-file zip uploads are
+    decompressed on the fly. Progress is measured in stored bytes consumed.
+    Rows identical to the stored product are not rewritten, and a file that
+    was already imported into the current catalogue is skipped unless force.
+    With workers > 1, large files are parsed in a process pool while this
+    thread remains the only database writer.
+    A cancellation request stops the import at the next batch boundary.
+    Large files (or bulk_load=True) run in bulk-load mode: secondary and
+    search indexes are rebuilt once at the end instead of per row, followed
+    by a WAL checkpoint.
+    checksum is the file's sha256 when the upload already computed it.
     """
+    bulk = False
+    webhooks = committed = None
     try:
         # Initialize progress
-        progress_tracker[job_id] = {
-            "status": "parsing",
-            "progress": 0.0,
-            "message": "Parsing CSV...",
-            "total_records": 0,
-            "processed_records": 0
-        }
+        update_job(job_id, status="parsing", progress=0.0, message="Parsing CSV...")
 
-        # Decode file content
-        file_text = file_content.decode('utf-8')
-        file_io = io.StringIO(file_text)
-        
-        # Use csv.DictReader for streaming
-        reader = csv.DictReader(file_io)
+        total_bytes = os.path.getsize(file_path) or 1
         
         # Validate required columns
-        required_columns = {'sku', 'name'}
-        if not required_columns.issubset(set(reader.fieldnames or [])):
-            raise ValueError(f"CSV must contain columns: {', '.join(required_columns)}")
+        index, data_start = read_header(file_path)
         
-        # Count total records first (for progress calculation)
-        file_io.seek(0)
-        reader = csv.DictReader(file_io)
-        total_records = sum(1 for _ in reader)
+        # A re-upload of a file that produced the current catalogue changes nothing
+        if checksum is None:
+            checksum = file_checksum(file_path)
+        previous = None if force else find_current_import(db, checksum)
+        db.rollback()
+        if previous:
+            update_job(
+                job_id,
+                status="complete",
+                progress=100.0,
+                total_records=previous.total_records,
+                processed_records=previous.total_records,
+                inserted_records=0,
+                updated_records=0,
+                unchanged_records=0,
+                skipped_records=previous.total_records,
+                message=f"File already imported (job {previous.job_id}); nothing changed."
+            )
+            return
         
-        progress_tracker[job_id]["total_records"] = total_records
-        progress_tracker[job_id]["status"] = "importing"
-        progress_tracker[job_id]["message"] = f"Importing {total_records} records..."
+        if use_parallel(file_path, workers):
+            batches = iter_parallel_batches(file_path, index, data_start, workers, BATCH_SIZE)
+        else:
+            batches = iter_record_batches(file_path, index, data_start, BATCH_SIZE)
         
-        # Reset file pointer and process
-        file_io.seek(0)
-        reader = csv.DictReader(file_io)
+        update_job(job_id, status="importing", message="Importing records...")
         
-        batch = []
-        batch_size = 1000
-        processed = 0
-        update_count = 0
+        if use_bulk_load(total_bytes, bulk_load):
+            begin_bulk_load(db)
+            db.commit()
+            bulk = True
         
-        for row in reader:
-            sku = row.get('sku', '').strip()
-            name = row.get('name', '').strip()
-            description = row.get('description', '').strip() if row.get('description') else None
-            
-            if not sku or not name:
-                continue  # Skip invalid rows
-            
-            # Case-insensitive SKU lookup
-            existing_product = db.query(Product).filter(
-                func.lower(Product.sku) == sku.lower()
-            ).first()
-            
-            if existing_product:
-                # Update existing product
-                existing_product.name = name
-                existing_product.description = description
-                existing_product.active = True  # Reactivate if inactive
-                update_count += 1
-            else:
-                # Create new product
-                product = Product(
-                    sku=sku,
-                    name=name,
-                    description=description,
-                    active=True
-                )
-                batch.append(product)
+        # Written products are announced as batched webhook events
+        webhooks = WebhookBatcher(job_id)
+        # Batcher state as of the last commit, for the error paths
+        committed = webhooks.snapshot()
+        
+        processed = 0
+        # Catalogue generation as of the last batch's transaction, before any later writer
+        generation = None
+        stats = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+        started = mark = time.perf_counter()
+        for batch, position, invalid in batches:
+            # Metrics are recorded per batch so the per-row path stays untouched
+            IMPORT_PHASE_SECONDS.inc(time.perf_counter() - mark, "parse")
             
-            processed += 1
+            # Stop cleanly between batches; everything committed so far stays
+            if cancel_requested(job_id):
+                raise ImportCancelled()
             
-            # Batch insert and commit periodically
-            if len(batch) >= batch_size:
-                db.bulk_save_objects(batch)
-                db.commit()
-                batch = []
-                
-                # Update progress
-                progress = (processed / total_records) * 100
-                progress_tracker[job_id]["progress"] = progress
-                progress_tracker[job_id]["processed_records"] = processed
-                progress_tracker[job_id]["message"] = f"Processed {processed}/{total_records} records..."
+            SQLITE_LOCK_WAIT.observe(begin_immediate(db), "import")
+            # Duplicate SKUs within a chunk are collapsed by the upsert (last row wins)
+            written = upsert_products(db, [
+                {
+                    "sku": sku,
+                    "name": name,
+                    "description": description,
+                    "active": True  # Reactivate if inactive
+                }
+                for sku, name, description in batch
+            ])
+            queued = webhooks.add(db, written)
+            if written["created"] or written["updated"]:
+                bump_counter(db, CATALOGUE_GENERATION)
+            generation = get_counter(db, CATALOGUE_GENERATION)
+            committing = time.perf_counter()
+            db.commit()
+            IMPORT_PHASE_SECONDS.inc(time.perf_counter() - committing, "commit")
+            committed = webhooks.snapshot()
+            if queued:
+                delivery_engine.notify()
+            processed += len(batch) + invalid
+            IMPORT_ROWS.inc(len(batch) + invalid)
+            stats["inserted"] += len(written["created"])
+            stats["updated"] += len(written["updated"])
+            stats["unchanged"] += len(written["unchanged"])
+            # Invalid records and SKUs repeated within the batch (collapsed by the upsert)
+            stats["skipped"] = processed - stats["inserted"] - stats["updated"] - stats["unchanged"]
             
-            # Commit updates periodically
-            if update_count > 0 and update_count % batch_size == 0:
-                db.commit()
+            # Update progress from the bytes consumed so far (throttled by the job store)
+            update_job(
+                job_id,
+                progress=min(position / total_bytes * 100, 99.9),
+                processed_records=processed,
+                **{f"{key}_records": value for key, value in stats.items()},
+                message=f"Processed {processed} records..."
+            )
+            mark = time.perf_counter()
+        
+        IMPORT_ROWS_PER_SECOND.set(processed / max(time.perf_counter() - started, 1e-9))
+        
+        if webhooks.flush(db):
+            db.commit()
+            delivery_engine.notify()
+        committed = webhooks.snapshot()
         
-        # Insert remaining batch
-        if batch:
-            db.bulk_save_objects(batch)
+        if bulk:
+            update_job(job_id, status="indexing", message="Rebuilding indexes...")
+            end_bulk_load(db, rebuild_search=bool(stats["inserted"] or stats["updated"]))
             db.commit()
+            bulk = False
+            checkpoint_wal()
         
-        # Final commit for any remaining updates
+        record_import(db, checksum, job_id, processed, generation)
         db.commit()
         
         # Mark as complete
-        progress_tracker[job_id]["status"] = "complete"
-        progress_tracker[job_id]["progress"] = 100.0
-        progress_tracker[job_id]["processed_records"] = processed
-        progress_tracker[job_id]["message"] = f"Import complete! Processed {processed} records."
+        update_job(
+            job_id,
+            status="complete",
+            progress=100.0,
+            total_records=processed,
+            processed_records=processed,
+            **{f"{key}_records": value for key, value in stats.items()},
+            message=f"Import complete! Processed {processed} records: {_stats_message(stats)}."
+        )
         
+    except ImportCancelled:
+        db.rollback()
+        batches.close()  # Shut down parser workers without reading the rest
+        _announce_committed(db, webhooks, committed)
+        update_job(
+            job_id,
+            status="cancelled",
+            processed_records=processed,
+            **{f"{key}_records": value for key, value in stats.items()},
+            message=f"Import cancelled after {processed} records: {_stats_message(stats)}."
+        )
+    
     except Exception as e:
-        progress_tracker[job_id]["status"] = "error"
-        progress_tracker[job_id]["message"] = f"Error: {str(e)}"
+        db.rollback()
+        try:
+            # Subscribers still hear about the batches committed before the failure
+            _announce_committed(db, webhooks, committed)
+        except Exception:
+            db.rollback()
+        update_job(job_id, status="error", message=f"Error: {str(e)}")
         raise
-
-
-def get_progress(job_id: str) -> Optional[Dict]:
-    """Get progress for a job"""
-    return progress_tracker.get(job_id)
-
-
-def create_job_id() -> str:
-    """Create a unique job ID"""
-    return str(uuid.uuid4())
-
+    
+    finally:
+        if bulk:
+            # Never leave the table without its indexes or the search index without its triggers
+            end_bulk_load(db)
+            db.commit()
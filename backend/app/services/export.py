@@ -0,0 +1,89 @@
+"""
+Streaming product export.
+
+Rows are read through a server-side cursor in batches of EXPORT_BATCH_ROWS
+plain tuples (no ORM objects or response models) and each batch is encoded
+and yielded straight away, so memory use does not grow with the catalogue.
+"""
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator, List
+from ..database import engine
+from ..models import Product
+
+# Rows fetched from the cursor and encoded per chunk
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+
+EXPORT_COLUMNS = ("id", "sku", "name", "description", "active", "created_at", "updated_at")
+
+
+def _format_time(value) -> str:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _encode_csv(rows: List[tuple]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        (row[0], row[1], row[2], row[3] or "", "true" if row[4] else "false", _format_time(row[5]), _format_time(row[6]))
+        for row in rows
+    )
+    return buffer.getvalue()
+
+
+def _encode_ndjson(rows: List[tuple]) -> str:
+    return "".join(
+        json.dumps({
+            "id": row[0],
+            "sku": row[1],
+            "name": row[2],
+            "description": row[3],
+            "active": bool(row[4]),
+            "created_at": _format_time(row[5]),
+            "updated_at": _format_time(row[6])
+        }) + "\n"
+        for row in rows
+    )
+
+
+def _iter_chunks(export_format: str, filters: Iterable) -> Iterator[bytes]:
+    columns = Product.__table__.c
+    query = Product.__table__.select().with_only_columns(*(columns[name] for name in EXPORT_COLUMNS))
+    for condition in filters:
+        query = query.where(condition)
+    query = query.order_by(columns.id)
+
+    if export_format == "csv":
+        encode = _encode_csv
+        yield (",".join(EXPORT_COLUMNS) + "\r\n").encode("utf-8")
+    else:
+        encode = _encode_ndjson
+
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=EXPORT_BATCH_ROWS).execute(query)
+        for rows in result.partitions():
+            yield encode(rows).encode("utf-8")
+
+
+def iter_export(export_format: str, filters: Iterable, compress: bool = False) -> Iterator[bytes]:
+    """Yield the encoded export, optionally as a gzip stream, one batch at a time"""
+    chunks = _iter_chunks(export_format, filters)
+    if not compress:
+        yield from chunks
+        return
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,46 @@
+"""
+Whole-file checksums of completed imports.
+
+A file whose checksum was imported while the catalogue was at its current
+generation (no product has changed since) would not change anything, so
+it is acknowledged without being parsed.
+"""
+import hashlib
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from ..models import ImportedFile
+from .counters import CATALOGUE_GENERATION, get_counter
+
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
+
+def file_checksum(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while block := f.read(CHECKSUM_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_current_import(db: Session, checksum: str) -> Optional[ImportedFile]:
+    """The earlier import of this file, if the catalogue is still as it left it"""
+    previous = db.query(ImportedFile).filter(ImportedFile.checksum == checksum).first()
+    if previous and previous.catalogue_generation == get_counter(db, CATALOGUE_GENERATION):
+        return previous
+    return None
+
+
+def record_import(db: Session, checksum: str, job_id: str, total_records: int, generation: Optional[int] = None) -> None:
+    """
+    Remember a completed import at the catalogue generation it left behind
+    (read inside its last batch's transaction; the current one if not given).
+    Caller commits.
+    """
+    db.merge(ImportedFile(
+        checksum=checksum,
+        job_id=job_id,
+        total_records=total_records,
+        catalogue_generation=get_counter(db, CATALOGUE_GENERATION) if generation is None else generation,
+        imported_at=datetime.utcnow()
+    ))
@@ -0,0 +1,181 @@
+"""
+Admission control for CSV imports.
+
+Uploads are queued here instead of each taking a thread from the shared
+default executor. At most IMPORT_CONCURRENCY imports run at a time (SQLite
+has a single writer, so more than one rarely helps); the rest wait in a
+priority queue (higher priority first, FIFO within a priority) and report
+their position through the job store as status "queued".
+"""
+import heapq
+import itertools
+import os
+import threading
+from typing import Dict, List, Optional
+from ..database import SessionLocal
+from .csv_processor import process_csv_file
+from .job_store import cancel_requested, update_job
+
+# Imports that may run at the same time in this worker
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "1"))
+
+
+def run_import(
+    file_path: str,
+    job_id: str,
+    workers: Optional[int] = None,
+    force: bool = False,
+    checksum: Optional[str] = None
+) -> None:
+    """Process a spooled CSV with its own database session, then delete the file"""
+    db = SessionLocal()
+    try:
+        process_csv_file(file_path, db, job_id, workers, force, checksum=checksum)
+    finally:
+        db.close()
+        os.remove(file_path)
+
+
+class ImportScheduler:
+    """Priority queue of spooled uploads drained by a fixed set of import threads"""
+
+    def __init__(self, concurrency: int = IMPORT_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        # Heap entries: (-priority, sequence, job_id, file_path, workers, force, checksum)
+        self._queue: List[tuple] = []
+        self._running: Dict[str, int] = {}
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+        # Queue position last written to the job store, by job id
+        self._announced: Dict[str, int] = {}
+        self._announce_lock = threading.Lock()
+
+    def submit(
+        self,
+        job_id: str,
+        file_path: str,
+        workers: Optional[int] = None,
+        priority: int = 0,
+        force: bool = False,
+        checksum: Optional[str] = None
+    ) -> int:
+        """
+        Queue a spooled upload; returns its position (1 = next to start).
+        checksum is the sha256 computed while the file was received, if any.
+        """
+        with self._cond:
+            heapq.heappush(self._queue, (-priority, next(self._sequence), job_id, file_path, workers, force, checksum))
+            self._start_threads()
+            self._cond.notify()
+        self._announce_positions()
+        return self.position(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Drop a queued import. Returns False if it is not queued in this worker."""
+        with self._cond:
+            entry = next((entry for entry in self._queue if entry[2] == job_id), None)
+            if entry is None:
+                return False
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+        self._discard(entry, status="cancelled", message="Import cancelled before it started.")
+        self._announce_positions()
+        return True
+
+    def position(self, job_id: str) -> int:
+        with self._cond:
+            order = [entry[2] for entry in sorted(self._queue)]
+        return order.index(job_id) + 1 if job_id in order else 0
+
+    def snapshot(self) -> Dict:
+        """Running and queued imports of this worker, in the order they will start"""
+        with self._cond:
+            queued = sorted(self._queue)
+            running = list(self._running)
+        return {
+            "concurrency": self.concurrency,
+            "running": running,
+            "queued": [
+                {"job_id": entry[2], "priority": -entry[0], "position": position}
+                for position, entry in enumerate(queued, start=1)
+            ]
+        }
+
+    def heartbeat(self) -> None:
+        """Refresh queued jobs so cleanup_jobs() does not mistake them for stale ones"""
+        self._announce_positions(refresh=True)
+
+    def stop(self) -> None:
+        """Stop starting imports and fail the ones still queued (their files are removed)"""
+        with self._cond:
+            self._stopping = True
+            queued, self._queue = self._queue, []
+            self._cond.notify_all()
+        for entry in queued:
+            self._discard(entry, status="error", message="Error: Import interrupted")
+
+    def _start_threads(self) -> None:
+        # Called with the condition held; threads are started on first use
+        while len(self._threads) < self.concurrency:
+            thread = threading.Thread(
+                target=self._work,
+                name=f"import-worker-{len(self._threads) + 1}",
+                daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def _announce_positions(self, refresh: bool = False) -> None:
+        """
+        Write the position of queued jobs whose position changed (of all of
+        them with refresh). The job store is written outside the queue lock;
+        announcements are serialized so an older order never lands last.
+        """
+        with self._announce_lock:
+            with self._cond:
+                order = [entry[2] for entry in sorted(self._queue)]
+            positions = {job_id: position for position, job_id in enumerate(order, start=1)}
+            changed = [
+                (job_id, position) for job_id, position in positions.items()
+                if refresh or self._announced.get(job_id) != position
+            ]
+            self._announced = positions
+            for job_id, position in changed:
+                update_job(job_id, status="queued", message=f"Queued (position {position})")
+
+    def _discard(self, entry: tuple, status: str, message: str) -> None:
+        try:
+            update_job(entry[2], status=status, message=message)
+        finally:
+            if os.path.exists(entry[3]):
+                os.remove(entry[3])
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                entry = heapq.heappop(self._queue)
+                job_id = entry[2]
+                self._running[job_id] = -entry[0]
+
+            try:
+                self._announce_positions()
+                if cancel_requested(job_id):
+                    # Cancelled through another worker while waiting here
+                    self._discard(entry, status="cancelled", message="Import cancelled before it started.")
+                else:
+                    run_import(entry[3], job_id, entry[4], entry[5], entry[6])
+            except Exception:
+                # The job store already records the failure; keep serving the queue
+                pass
+            finally:
+                with self._cond:
+                    self._running.pop(job_id, None)
+
+
+import_scheduler = ImportScheduler()
@@ -0,0 +1,179 @@
+"""
+Dialect-specific write paths for product upserts.
+
+upsert_products() decides which rows are new or changed; an ingest backend
+then writes them with the fastest native mechanism of the database:
+
+  * sqlite     - INSERT ... ON CONFLICT(sku_normalized) DO UPDATE ... RETURNING,
+                 executemany (SQLite 3.35+; older libraries use the fallback)
+  * postgresql - COPY into a session temp table, then one
+                 INSERT ... SELECT ... ON CONFLICT DO UPDATE merge
+  * others     - portable UPDATE + INSERT executemany
+
+Every backend leaves rows whose content hash did not change untouched, keeps
+the stored SKU casing and returns the ids of the rows it wrote by normalized
+SKU. None of them commit; the caller owns the transaction.
+"""
+import io
+import sqlite3
+from typing import Dict, List
+from sqlalchemy import bindparam, column, func, insert, select, table, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection
+from ..models import Product
+
+# Columns written by an upsert, in COPY order
+WRITE_COLUMNS = ("sku", "sku_normalized", "name", "description", "active", "content_hash")
+
+_products = Product.__table__
+
+
+def _merge_values(excluded) -> Dict:
+    """SET clause of the upsert: content columns from the new row, SKU casing kept"""
+    return {
+        "name": excluded.name,
+        "description": excluded.description,
+        "active": excluded.active,
+        "content_hash": excluded.content_hash,
+        "updated_at": func.now()
+    }
+
+
+class IngestBackend:
+    """Portable fallback: UPDATE the rows that exist, INSERT the rest"""
+    dialect = None
+    # Whether the database library in use supports this write path
+    available = True
+
+    def __init__(self):
+        self._update = update(_products).where(
+            _products.c.sku_normalized == bindparam("key")
+        ).values(
+            name=bindparam("name"),
+            description=bindparam("description"),
+            active=bindparam("active"),
+            content_hash=bindparam("content_hash"),
+            updated_at=func.now()
+        )
+
+    def write(self, connection: Connection, created: List[Dict], updated: List[Dict]) -> Dict[str, int]:
+        if updated:
+            # Only the SET parameters: any other column key would be written too (e.g. the SKU casing)
+            connection.execute(self._update, [
+                {"key": row["sku_normalized"], "name": row["name"], "description": row["description"],
+                 "active": row["active"], "content_hash": row["content_hash"]}
+                for row in updated
+            ])
+        if created:
+            connection.execute(insert(_products), created)
+        keys = [row["sku_normalized"] for row in created + updated]
+        return dict(connection.execute(
+            select(_products.c.sku_normalized, _products.c.id).where(_products.c.sku_normalized.in_(keys))
+        ).all()) if keys else {}
+
+
+class SQLiteIngest(IngestBackend):
+    """INSERT ... ON CONFLICT DO UPDATE ... RETURNING as a Core executemany"""
+    dialect = "sqlite"
+    # RETURNING arrived in SQLite 3.35
+    available = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+    def __init__(self):
+        stmt = sqlite_insert(_products)
+        self._upsert = stmt.on_conflict_do_update(
+            index_elements=[_products.c.sku_normalized],
+            set_=_merge_values(stmt.excluded),
+            where=_products.c.content_hash.is_distinct_from(stmt.excluded.content_hash)
+        ).returning(_products.c.sku_normalized, _products.c.id)
+
+    def write(self, connection: Connection, created: List[Dict], updated: List[Dict]) -> Dict[str, int]:
+        rows = created + updated
+        return dict(connection.execute(self._upsert, rows).all()) if rows else {}
+
+
+class PostgresIngest(IngestBackend):
+    """
+    COPY the rows into a temp staging table and merge them in one statement.
+    The staging table lives as long as the pooled connection and is emptied
+    at every commit, so it is created at most once per connection.
+    """
+    dialect = "postgresql"
+    STAGE_TABLE = "products_ingest_stage"
+
+    _CREATE_STAGE = (
+        f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} ("
+        "sku VARCHAR, sku_normalized VARCHAR, name VARCHAR, description VARCHAR, "
+        "active BOOLEAN, content_hash VARCHAR(16)) ON COMMIT DELETE ROWS"
+    )
+    _COPY = f"COPY {STAGE_TABLE} ({', '.join(WRITE_COLUMNS)}) FROM STDIN"
+
+    def __init__(self):
+        super().__init__()
+        self._stage = table(self.STAGE_TABLE, *(column(name) for name in WRITE_COLUMNS))
+        stmt = postgresql_insert(_products).from_select(list(WRITE_COLUMNS), select(self._stage))
+        self._merge = stmt.on_conflict_do_update(
+            index_elements=[_products.c.sku_normalized],
+            set_=_merge_values(stmt.excluded),
+            where=_products.c.content_hash.is_distinct_from(stmt.excluded.content_hash)
+        ).returning(_products.c.sku_normalized, _products.c.id)
+        self._clear = f"TRUNCATE {self.STAGE_TABLE}"
+
+    def write(self, connection: Connection, created: List[Dict], updated: List[Dict]) -> Dict[str, int]:
+        rows = created + updated
+        if not rows:
+            return {}
+        connection.exec_driver_sql(self._CREATE_STAGE)
+        # Rows left by an earlier statement in this transaction must not be merged twice
+        connection.exec_driver_sql(self._clear)
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            block = encode_copy_rows(rows)
+            if hasattr(cursor, "copy"):
+                # psycopg 3
+                with cursor.copy(self._COPY) as copy:
+                    copy.write(block)
+            elif hasattr(cursor, "copy_expert"):
+                # psycopg2
+                cursor.copy_expert(self._COPY, io.StringIO(block))
+            else:
+                # Drivers without COPY support still get the single-statement merge
+                cursor.close()
+                cursor = None
+                connection.execute(insert(self._stage), [{name: row[name] for name in WRITE_COLUMNS} for row in rows])
+        finally:
+            if cursor is not None:
+                cursor.close()
+        return dict(connection.execute(self._merge).all())
+
+
+def _copy_text(value) -> str:
+    """One field in COPY text format"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def encode_copy_rows(rows: List[Dict]) -> str:
+    """Rows as a COPY ... FROM STDIN text block (tab separated, \\N for NULL)"""
+    return "".join(
+        "\t".join(_copy_text(row[name]) for name in WRITE_COLUMNS) + "\n"
+        for row in rows
+    )
+
+
+_BACKENDS = {backend.dialect: backend for backend in (SQLiteIngest(), PostgresIngest()) if backend.available}
+_fallback = IngestBackend()
+
+
+def ingest_backend(dialect: str) -> IngestBackend:
+    """The native write path for a dialect name, or the portable fallback"""
+    return _BACKENDS.get(dialect, _fallback)
@@ -0,0 +1,170 @@
+import calendar
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from ..database import SessionLocal
+from ..models import ImportJob
+from .progress_bus import progress_bus
+
+# Minimum seconds between progress writes for one job (status changes are always written)
+PROGRESS_WRITE_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "0.5"))
+# Finished jobs are deleted this many seconds after their last update
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "86400"))
+# Unfinished jobs that stop reporting for this long are marked as interrupted
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "900"))
+
+TERMINAL_STATUSES = ("complete", "error", "cancelled")
+
+# job_id -> monotonic time of the last progress write made by this process
+_last_write: Dict[str, float] = {}
+_last_write_lock = threading.Lock()
+
+
+class ImportCancelled(Exception):
+    """Raised by an importer that noticed a cancellation request"""
+
+
+def create_job_id() -> str:
+    """Create a unique job ID"""
+    return str(uuid.uuid4())
+
+
+def _to_dict(job: ImportJob) -> Dict:
+    return {
+        "status": job.status,
+        "progress": job.progress,
+        "message": job.message,
+        "total_records": job.total_records,
+        "processed_records": job.processed_records,
+        "inserted_records": job.inserted_records,
+        "updated_records": job.updated_records,
+        "unchanged_records": job.unchanged_records,
+        "skipped_records": job.skipped_records,
+        "revision": job_revision(job.updated_at)
+    }
+
+
+def job_revision(updated_at: datetime) -> int:
+    """Millisecond timestamp of a job's last write, comparable with progress_bus revisions"""
+    return int(calendar.timegm(updated_at.utctimetuple()) * 1000 + updated_at.microsecond // 1000)
+
+
+def create_job(job_id: str, status: str = "pending", message: str = "Upload received") -> None:
+    """Record a new job so every worker can report its progress"""
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.add(ImportJob(
+            id=job_id,
+            status=status,
+            progress=0.0,
+            message=message,
+            processed_records=0,
+            created_at=now,
+            updated_at=now
+        ))
+        db.commit()
+    finally:
+        db.close()
+    progress_bus.publish(job_id, {
+        "status": status,
+        "progress": 0.0,
+        "message": message,
+        "total_records": None,
+        "processed_records": 0
+    }, create=True)
+
+
+def update_job(job_id: str, **fields) -> None:
+    """
+    Update a job's progress fields.
+    Changes are published to this worker's progress bus immediately.
+    Database writes that only report progress are throttled to one per
+    PROGRESS_WRITE_INTERVAL; writes that change the status always go through.
+    """
+    # Subscribers in this worker see every change; the database write is throttled
+    progress_bus.publish(job_id, fields, finished=fields.get("status") in TERMINAL_STATUSES)
+    
+    now = time.monotonic()
+    with _last_write_lock:
+        if "status" not in fields and now - _last_write.get(job_id, 0.0) < PROGRESS_WRITE_INTERVAL:
+            return
+        if fields.get("status") in TERMINAL_STATUSES:
+            _last_write.pop(job_id, None)
+        else:
+            _last_write[job_id] = now
+
+    fields["updated_at"] = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.query(ImportJob).filter(ImportJob.id == job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """Get progress for a job"""
+    db = SessionLocal()
+    try:
+        job = db.query(ImportJob).filter(ImportJob.id == job_id).first()
+        return _to_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def request_cancel(job_id: str) -> Optional[str]:
+    """
+    Ask for a job to be stopped. Returns the job's status at the time of the
+    request, or None if the job does not exist. Finished jobs are left alone.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(ImportJob).filter(ImportJob.id == job_id).first()
+        if not job:
+            return None
+        if job.status not in TERMINAL_STATUSES:
+            job.cancel_requested = True
+            db.commit()
+        return job.status
+    finally:
+        db.close()
+
+
+def cancel_requested(job_id: str) -> bool:
+    """Whether a cancellation was requested for the job (from any worker)"""
+    db = SessionLocal()
+    try:
+        return bool(db.query(ImportJob.cancel_requested).filter(ImportJob.id == job_id).scalar())
+    finally:
+        db.close()
+
+
+def cleanup_jobs() -> int:
+    """
+    Delete finished jobs past their TTL and mark jobs that stopped reporting
+    (e.g. their worker was restarted) as interrupted.
+    Returns the number of deleted jobs.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.query(ImportJob).filter(
+            ImportJob.status.notin_(TERMINAL_STATUSES),
+            ImportJob.updated_at < now - timedelta(seconds=JOB_STALE_SECONDS)
+        ).update({
+            "status": "error",
+            "message": "Error: Import interrupted",
+            "updated_at": now
+        }, synchronize_session=False)
+        deleted = db.query(ImportJob).filter(
+            ImportJob.status.in_(TERMINAL_STATUSES),
+            ImportJob.updated_at < now - timedelta(seconds=JOB_TTL_SECONDS)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
@@ -0,0 +1,61 @@
+import base64
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+# Seconds a filtered total is reused before it is counted again
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "5"))
+# Maximum number of distinct filter combinations kept in the count cache
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "256"))
+
+
+def encode_cursor(last_id: int) -> str:
+    """Build the opaque next_cursor token pointing after the given product id"""
+    payload = json.dumps({"after_id": last_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Return the product id a cursor points after. Raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        after_id = json.loads(base64.urlsafe_b64decode(padded))["after_id"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(after_id, int) or after_id < 0:
+        raise ValueError("Invalid cursor")
+    return after_id
+
+
+class CountCache:
+    """Small TTL + LRU cache for COUNT(*) results keyed by filter values"""
+
+    def __init__(self, ttl: float = COUNT_CACHE_TTL, max_entries: int = COUNT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_count(self, key: Hashable, count: Callable[[], int]) -> int:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        value = count()
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, pairwise
+from typing import Dict, Iterator, List, Optional, Tuple
+from .csv_parsing import Row, detect_compression, iter_record_batches, iter_record_boundaries, parse_range
+
+# Default number of parser processes; 0 or 1 keeps imports on the serial path
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "0"))
+# Files smaller than this are always parsed serially
+PARALLEL_MIN_BYTES = int(os.getenv("IMPORT_PARALLEL_MIN_BYTES", str(8 * 1024 * 1024)))
+# Approximate size of the byte range handed to each parse task
+PARALLEL_RANGE_BYTES = int(os.getenv("IMPORT_PARALLEL_RANGE_BYTES", str(4 * 1024 * 1024)))
+
+
+def use_parallel(file_path: str, workers: Optional[int]) -> bool:
+    """Whether an import of this file should use the process pool (compressed files cannot be split)"""
+    workers = IMPORT_WORKERS if workers is None else workers
+    return (
+        workers > 1
+        and os.path.getsize(file_path) >= PARALLEL_MIN_BYTES
+        and detect_compression(file_path) is None
+    )
+
+
+def iter_parallel_batches(
+    file_path: str,
+    index: Dict[str, Optional[int]],
+    data_start: int,
+    workers: Optional[int],
+    batch_size: int
+) -> Iterator[Tuple[List[Row], int, int]]:
+    """
+    Parse record-aligned byte ranges of the file in a process pool.
+    Yields (rows, byte_offset, invalid_records) batches in file order so a
+    single writer applies them exactly as the serial path would. Should a
+    range turn out not to end on a record boundary, the rest of the file
+    from its start is parsed serially.
+    """
+    workers = IMPORT_WORKERS if workers is None else workers
+    # Ranges are handed out while the rest of the file is still being scanned
+    boundaries = iter_record_boundaries(file_path, data_start, PARALLEL_RANGE_BYTES)
+    pending_ranges = pairwise(boundaries)
+
+    # Spawned workers only import csv_parsing and never inherit the app's DB connections
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        in_flight = deque()
+        try:
+            while True:
+                # Keep a bounded number of parsed ranges waiting for the writer
+                for start, end in islice(pending_ranges, workers * 2 - len(in_flight)):
+                    in_flight.append((pool.submit(parse_range, file_path, start, end, index), start, end))
+                if not in_flight:
+                    break
+
+                future, start, end = in_flight.popleft()
+                rows, invalid, complete = future.result()
+                if not complete:
+                    yield from iter_record_batches(file_path, index, start, batch_size)
+                    return
+                if not rows:
+                    yield rows, end, invalid
+                for i in range(0, len(rows), batch_size):
+                    # Invalid records of the range are reported with its first batch
+                    yield rows[i:i + batch_size], end, invalid if i == 0 else 0
+        finally:
+            for future, _, _ in in_flight:
+                future.cancel()
@@ -0,0 +1,76 @@
+"""
+Lean read path for product responses.
+
+Products are selected as plain column tuples (no ORM instances in the
+identity map) and encoded straight to JSON bytes with the standard library
+encoder. The output is byte-for-byte what ProductResponse/ProductListResponse
+produce through Pydantic: same key order, compact separators, UTF-8 text and
+ISO 8601 timestamps with "Z" for UTC.
+"""
+import json
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence
+from sqlalchemy import Select, select
+from ..models import Product
+
+# Columns in ProductResponse field order
+PRODUCT_COLUMNS = (
+    Product.sku,
+    Product.name,
+    Product.description,
+    Product.active,
+    Product.id,
+    Product.created_at,
+    Product.updated_at
+)
+ID_POSITION = 4
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def select_products(filters: Iterable = ()) -> Select:
+    """Column-tuple select of products matching the filters"""
+    return select(*PRODUCT_COLUMNS).where(*filters)
+
+
+def _format_time(value: Optional[datetime]) -> Optional[str]:
+    if value is None:
+        return None
+    text = value.isoformat()
+    return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+
+def product_dict(row: Sequence) -> dict:
+    return {
+        "sku": row[0],
+        "name": row[1],
+        "description": row[2],
+        "active": bool(row[3]),
+        "id": row[4],
+        "created_at": _format_time(row[5]),
+        "updated_at": _format_time(row[6])
+    }
+
+
+def encode_product(row: Sequence) -> bytes:
+    """JSON of one product row, identical to ProductResponse.model_dump_json()"""
+    return _encode(product_dict(row)).encode("utf-8")
+
+
+def encode_product_page(
+    rows: List[Sequence],
+    total: Optional[int],
+    page: int,
+    page_size: int,
+    total_pages: Optional[int],
+    next_cursor: Optional[str]
+) -> bytes:
+    """JSON of a list page, identical to ProductListResponse.model_dump_json()"""
+    return _encode({
+        "items": [product_dict(row) for row in rows],
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": total_pages,
+        "next_cursor": next_cursor
+    }).encode("utf-8")
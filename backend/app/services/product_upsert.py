@@ -0,0 +1,84 @@
+import time
+from typing import Dict, Iterable, List
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..models import Product, normalize_sku, product_fingerprint
+from .catalogue_stats import adjust_stats
+from .ingest import ingest_backend
+from .metrics import IMPORT_PHASE_SECONDS
+
+
+def dedupe_rows(rows: Iterable[Dict]) -> Dict[str, Dict]:
+    """
+    Key rows by normalized SKU. When a SKU repeats (in any case) the last row
+    wins, but it keeps the position and SKU casing of the first occurrence so
+    the result does not depend on how a file is split into chunks.
+    """
+    pending: Dict[str, Dict] = {}
+    for row in rows:
+        key = normalize_sku(row["sku"])
+        first = pending.get(key)
+        pending[key] = row if first is None else {**row, "sku": first["sku"]}
+    return pending
+
+
+def upsert_products(db: Session, rows: Iterable[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Insert or update a chunk of products in one set-based statement.
+    Each row is a dict with sku, name, description and active.
+    Rows identical to the stored product (same content hash) are not written.
+    Product counts are adjusted for the created rows and changed active flags;
+    call begin_immediate() first so no other writer can change the
+    classification between the lookup and the write.
+    Returns the rows, with their product "id", split into "created", "updated" and "unchanged".
+    Does not commit; the caller owns the transaction.
+    """
+    pending = dedupe_rows(rows)
+    if not pending:
+        return {"created": [], "updated": [], "unchanged": []}
+
+    started = time.perf_counter()
+    keys: List[str] = list(pending)
+    existing = {
+        key: (product_id, content_hash, stored_active)
+        for key, product_id, content_hash, stored_active in db.execute(
+            select(Product.sku_normalized, Product.id, Product.content_hash, Product.active)
+            .where(Product.sku_normalized.in_(keys))
+        )
+    }
+    looked_up = time.perf_counter()
+    IMPORT_PHASE_SECONDS.inc(looked_up - started, "lookup")
+
+    result = {"created": [], "updated": [], "unchanged": []}
+    active_delta = 0
+    for key, row in pending.items():
+        active = row.get("active", True)
+        params = {
+            "sku": row["sku"],
+            "sku_normalized": key,
+            "name": row["name"],
+            "description": row.get("description"),
+            "active": active,
+            "content_hash": product_fingerprint(row["name"], row.get("description"), active)
+        }
+        if key not in existing:
+            result["created"].append(params)
+            active_delta += bool(active)
+        elif existing[key][1] == params["content_hash"]:
+            result["unchanged"].append(params)
+        else:
+            result["updated"].append(params)
+            active_delta += bool(active) - bool(existing[key][2])
+
+    if result["created"] or result["updated"]:
+        # Native write path of the session's database; avoids the per-row ORM bulk path
+        connection = db.connection()
+        ids = ingest_backend(connection.dialect.name).write(connection, result["created"], result["updated"])
+        adjust_stats(db, total=len(result["created"]), active=active_delta)
+        for params in result["created"]:
+            params["id"] = ids.get(params["sku_normalized"])
+    for kind in ("updated", "unchanged"):
+        for params in result[kind]:
+            params["id"] = existing[params["sku_normalized"]][0]
+    IMPORT_PHASE_SECONDS.inc(time.perf_counter() - looked_up, "flush")
+    return result
@@ -0,0 +1,104 @@
+"""
+In-process publish/subscribe bus for job progress.
+
+The job store publishes every change of a job created in this worker;
+SSE subscribers sleep on an asyncio.Event until the job's revision moves
+past the one they last sent. Subscribers always read the latest state, so
+bursts of updates between two wake-ups are coalesced into one event.
+Revisions are millisecond timestamps (strictly increasing per job), so they
+are comparable with the updated_at of jobs polled from the database.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+# Channels of finished jobs are kept this long for late subscribers
+FINISHED_CHANNEL_TTL = 60.0
+
+
+class _Channel:
+    def __init__(self, state: Dict):
+        self.state = state
+        self.revision = 0
+        self.finished_at: Optional[float] = None
+        self.waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+
+class ProgressBus:
+    def __init__(self):
+        self._channels: Dict[str, _Channel] = {}
+        self._lock = threading.Lock()
+
+    def tracks(self, job_id: str) -> bool:
+        """Whether the job publishes to this worker's bus"""
+        with self._lock:
+            return job_id in self._channels
+
+    def publish(self, job_id: str, fields: Dict, create: bool = False, finished: bool = False) -> None:
+        """
+        Merge fields into the job's state and wake its subscribers.
+        Safe to call from any thread. Jobs are only tracked once created.
+        """
+        now = time.monotonic()
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is None:
+                if not create:
+                    return
+                channel = self._channels[job_id] = _Channel({})
+            channel.state = {**channel.state, **fields}
+            channel.revision = max(channel.revision + 1, int(time.time() * 1000))
+            if finished:
+                channel.finished_at = now
+            waiters = list(channel.waiters)
+            self._prune(now)
+
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The subscriber's loop has been closed
+                pass
+
+    async def wait(self, job_id: str, after_revision: int, timeout: float) -> Optional[Tuple[int, Dict]]:
+        """
+        Return (revision, state) once the job's revision is greater than
+        after_revision (or the job has finished), or None after timeout
+        seconds without a change.
+        """
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._lock:
+            channel = self._channels.get(job_id)
+            if channel is None:
+                return None
+            if channel.revision > after_revision or channel.finished_at is not None:
+                # A finished job is returned even if already seen, so the stream can end
+                return channel.revision, channel.state
+            channel.waiters.add(waiter)
+
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                channel.waiters.discard(waiter)
+
+        with self._lock:
+            return channel.revision, channel.state
+
+    def _prune(self, now: float) -> None:
+        # Called with the lock held
+        expired = [
+            job_id for job_id, channel in self._channels.items()
+            if channel.finished_at is not None
+            and now - channel.finished_at > FINISHED_CHANNEL_TTL
+            and not channel.waiters
+        ]
+        for job_id in expired:
+            del self._channels[job_id]
+
+
+progress_bus = ProgressBus()
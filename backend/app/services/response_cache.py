@@ -0,0 +1,85 @@
+"""
+Serialized product responses keyed by the catalogue generation.
+
+Every transaction that changes products bumps the CATALOGUE_GENERATION
+counter, so a response built at generation N stays valid until the counter
+moves. That gives cheap validators (ETags) for conditional GETs and lets
+serialized list pages be reused without any explicit invalidation: entries
+of older generations are simply never asked for again and are dropped.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+from .metrics import registry
+
+# Maximum number of serialized responses kept per worker
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# Upper bound on the bytes held by the response cache per worker
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+CACHE_REQUESTS = registry.counter(
+    "importer_response_cache_requests_total",
+    "Product reads by outcome (hit, miss, not_modified)",
+    ("outcome",)
+)
+
+
+def catalogue_etag(generation: int, key: Hashable) -> str:
+    """Strong ETag for the response identified by key at a catalogue generation"""
+    digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=6).hexdigest()
+    return f'"{generation}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names the current ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ResponseCache:
+    """LRU of serialized response bodies that only holds the newest generation"""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._generation = -1
+        self._lock = threading.Lock()
+
+    def get(self, generation: int, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            if generation != self._generation:
+                return None
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, generation: int, key: Hashable, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if generation < self._generation:
+                # Built from a read that raced with a newer write
+                return
+            if generation > self._generation:
+                self._entries.clear()
+                self._bytes = 0
+                self._generation = generation
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._bytes -= len(self._entries.popitem(last=False)[1])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
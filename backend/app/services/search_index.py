@@ -0,0 +1,121 @@
+"""
+SQLite FTS5 trigram index serving the sku/name/description substring filters.
+
+products_fts is an external-content table over products, kept in sync by
+triggers. Bulk writers can drop the triggers for the duration of a large
+import and rebuild the whole index in one pass afterwards.
+"""
+import os
+from sqlalchemy import column, func, select, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from ..models import Product
+
+SEARCH_TABLE = "products_fts"
+SEARCH_COLUMNS = ("sku", "name", "description")
+
+# Imports of files at least this large rebuild the index once instead of row by row
+SEARCH_REBUILD_MIN_BYTES = int(os.getenv("SEARCH_REBUILD_MIN_BYTES", str(5 * 1024 * 1024)))
+
+_CREATE_TABLE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "sku, name, description, content='products', content_rowid='id', tokenize='trigram')"
+)
+
+_TRIGGERS = {
+    "products_fts_ai": (
+        f"CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, sku, name, description) "
+        f"VALUES (new.id, new.sku, new.name, new.description); END"
+    ),
+    "products_fts_ad": (
+        f"CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, sku, name, description) "
+        f"VALUES ('delete', old.id, old.sku, old.name, old.description); END"
+    ),
+    "products_fts_au": (
+        f"CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF sku, name, description ON products BEGIN "
+        f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, sku, name, description) "
+        f"VALUES ('delete', old.id, old.sku, old.name, old.description); "
+        f"INSERT INTO {SEARCH_TABLE}(rowid, sku, name, description) "
+        f"VALUES (new.id, new.sku, new.name, new.description); END"
+    ),
+}
+
+_search_table = table(SEARCH_TABLE, column("rowid"), *(column(name) for name in SEARCH_COLUMNS))
+
+# Set by install_search_index() when the database supports FTS5 trigram tables
+_enabled = False
+
+
+def search_enabled() -> bool:
+    return _enabled
+
+
+def install_search_index(engine: Engine) -> bool:
+    """
+    Create the FTS table and sync triggers if the database supports them.
+    The index is rebuilt when it is new or when triggers were missing (e.g. a
+    bulk import was interrupted), since it may then be out of date.
+    """
+    global _enabled
+    if engine.dialect.name != "sqlite":
+        return False
+
+    with engine.begin() as conn:
+        existing = set(conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')"
+        )).scalars())
+        try:
+            conn.execute(text(_CREATE_TABLE))
+        except Exception:
+            # SQLite built without FTS5 or the trigram tokenizer (< 3.34)
+            return False
+        for ddl in _TRIGGERS.values():
+            conn.execute(text(ddl))
+        if SEARCH_TABLE not in existing or not set(_TRIGGERS).issubset(existing):
+            conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+    _enabled = True
+    return True
+
+
+def suspend_search_sync(db: Session) -> None:
+    """Drop the sync triggers so bulk writes skip per-row index maintenance"""
+    if not _enabled:
+        return
+    for name in _TRIGGERS:
+        db.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+
+
+def resume_search_sync(db: Session, rebuild: bool = True) -> None:
+    """Recreate the sync triggers and, by default, rebuild the index in one pass"""
+    if not _enabled:
+        return
+    for ddl in _TRIGGERS.values():
+        db.execute(text(ddl))
+    if rebuild:
+        db.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+
+def detach_search_table(db: Session, new_name: str) -> None:
+    """Rename the index out of the way (O(1)); call suspend_search_sync() first"""
+    if _enabled:
+        db.execute(text(f"ALTER TABLE {SEARCH_TABLE} RENAME TO {new_name}"))
+
+
+def create_search_table(db: Session) -> None:
+    """Create an empty index; call resume_search_sync(rebuild=False) afterwards"""
+    if _enabled:
+        db.execute(text(_CREATE_TABLE))
+
+
+def contains_filter(field: str, term: str):
+    """
+    Case-insensitive substring filter on a product column.
+    Served by the trigram index when available, else lower(col) LIKE '%term%'.
+    """
+    if _enabled:
+        matches = select(_search_table.c.rowid).where(_search_table.c[field].like(f"%{term}%"))
+        return Product.id.in_(matches)
+    return func.lower(getattr(Product, field)).contains(term.lower())
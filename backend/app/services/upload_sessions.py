@@ -0,0 +1,273 @@
+"""
+Resumable chunked uploads.
+
+A client creates a session, PUTs byte ranges in order and finalizes it. Each
+range is streamed straight into a spool file and acknowledged by advancing
+the session's `received` offset in the database, so a client whose
+connection dropped asks for the session and carries on from that offset.
+Sessions live in the database and spool files in UPLOAD_SPOOL_DIR, so any
+worker on the host can accept the next chunk.
+
+The sha256 of the file is computed as chunks arrive. A worker can only
+continue a digest of chunks it received itself, so a session whose chunks
+went to several workers (or that outlived a restart) is hashed from its
+spool file at finalization instead.
+"""
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from ..database import SessionLocal
+from ..models import UploadSession
+from .import_history import file_checksum
+
+# Directory for partially uploaded files; must be shared by all workers on the host
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "importer-uploads"))
+# Largest byte range accepted in one PUT
+UPLOAD_MAX_CHUNK_BYTES = int(os.getenv("UPLOAD_MAX_CHUNK_BYTES", str(64 * 1024 * 1024)))
+# Chunk size suggested to clients
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+# Received bytes are written to the spool file in blocks of about this size
+SPOOL_WRITE_BYTES = 1024 * 1024
+# Sessions untouched for this long are deleted together with their spool files
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", "86400"))
+
+_CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+# Running sha256 per session: (acknowledged offset, digest of the bytes before it)
+_digests: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+# Digest of a chunk written but not acknowledged yet: (start, end, digest up to end)
+_written: Dict[str, Tuple[int, int, "hashlib._Hash"]] = {}
+
+
+class OffsetMismatch(Exception):
+    """The chunk does not start at the acknowledged offset"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"Upload continues at byte {offset}")
+        self.offset = offset
+
+
+class ChunkInterrupted(Exception):
+    """Reading a chunk failed after `written` bytes had been stored"""
+
+    def __init__(self, written: int, error: Exception):
+        super().__init__(str(error))
+        self.written = written
+        self.error = error
+
+
+def parse_content_range(header: str) -> Tuple[int, int, Optional[int]]:
+    """Parse 'bytes start-end/total' (total may be '*') into (start, end exclusive, total)"""
+    match = _CONTENT_RANGE.match((header or "").strip())
+    if not match:
+        raise ValueError("Content-Range must look like 'bytes start-end/total'")
+    start, last = int(match.group(1)), int(match.group(2))
+    total = None if match.group(3) == "*" else int(match.group(3))
+    if last < start or (total is not None and last >= total):
+        raise ValueError("Content-Range is out of bounds")
+    return start, last + 1, total
+
+
+def _to_dict(session: UploadSession) -> Dict:
+    return {
+        "upload_id": session.id,
+        "filename": session.filename,
+        "size": session.size,
+        "offset": session.received,
+        "status": session.status,
+        "job_id": session.job_id,
+        "chunk_size": UPLOAD_CHUNK_BYTES
+    }
+
+
+def create_session(filename: str, size: Optional[int] = None) -> Dict:
+    """Start a session with an empty spool file"""
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    session_id = str(uuid.uuid4())
+    spool_path = os.path.join(UPLOAD_SPOOL_DIR, f"{session_id}.part")
+    open(spool_path, "wb").close()
+
+    now = datetime.utcnow()
+    session = UploadSession(
+        id=session_id,
+        filename=filename,
+        size=size,
+        received=0,
+        spool_path=spool_path,
+        status="open",
+        created_at=now,
+        updated_at=now
+    )
+    db = SessionLocal()
+    try:
+        db.add(session)
+        db.commit()
+        return _to_dict(session)
+    except Exception:
+        os.remove(spool_path)
+        raise
+    finally:
+        db.close()
+
+
+def get_session(session_id: str) -> Optional[Dict]:
+    db = SessionLocal()
+    try:
+        session = db.get(UploadSession, session_id)
+        return _to_dict(session) if session else None
+    finally:
+        db.close()
+
+
+def _spool_path(session_id: str) -> str:
+    return os.path.join(UPLOAD_SPOOL_DIR, f"{session_id}.part")
+
+
+def _store(spool, parts: List[bytes], digest: Optional["hashlib._Hash"], sync: bool = False) -> None:
+    """Append received parts to the spool file (in a worker thread)"""
+    for part in parts:
+        spool.write(part)
+        if digest is not None:
+            digest.update(part)
+    if sync:
+        spool.flush()
+        os.fsync(spool.fileno())
+
+
+async def write_chunk(session_id: str, start: int, end: int, chunks: AsyncIterator[bytes]) -> int:
+    """
+    Stream a body into the spool file at `start`, at most `end - start` bytes.
+    Returns the number of bytes written. If the body fails part way (a dropped
+    connection, or more bytes than the range) ChunkInterrupted carries the
+    bytes already on disk, which the caller can still acknowledge.
+    File writes run in a thread so the event loop keeps serving requests.
+    """
+    limit = end - start
+    written = 0
+    # Continue the digest of the bytes before start, if this worker has it
+    offset, digest = _digests.get(session_id, (0, hashlib.sha256()))
+    digest = digest.copy() if offset == start else None
+    error = None
+    with open(_spool_path(session_id), "r+b") as spool:
+        spool.seek(start)
+        buffered, size = [], 0
+        try:
+            async for chunk in chunks:
+                if written + size + len(chunk) > limit:
+                    raise ValueError("Body is longer than the Content-Range")
+                buffered.append(chunk)
+                size += len(chunk)
+                if size >= SPOOL_WRITE_BYTES:
+                    await asyncio.to_thread(_store, spool, buffered, digest)
+                    written += size
+                    buffered, size = [], 0
+        except Exception as e:
+            error = e
+        # Bytes received before a failure are stored as well
+        await asyncio.to_thread(_store, spool, buffered, digest, True)
+        written += size
+    if digest is not None:
+        _written[session_id] = (start, start + written, digest)
+    if error is not None:
+        raise ChunkInterrupted(written, error) from error
+    return written
+
+
+def acknowledge(session_id: str, start: int, received: int) -> Dict:
+    """
+    Advance the acknowledged offset from `start` to `received`.
+    Raises OffsetMismatch if another request moved it in the meantime.
+    """
+    db = SessionLocal()
+    try:
+        updated = db.query(UploadSession).filter(
+            UploadSession.id == session_id,
+            UploadSession.status == "open",
+            UploadSession.received == start
+        ).update({"received": received, "updated_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        chunk = _written.pop(session_id, None)
+        if updated and chunk is not None and chunk[:2] == (start, received):
+            _digests[session_id] = (received, chunk[2])
+        else:
+            _digests.pop(session_id, None)
+        session = db.get(UploadSession, session_id)
+        if not updated:
+            raise OffsetMismatch(session.received if session else 0)
+        return _to_dict(session)
+    finally:
+        db.close()
+
+
+def finalize_session(session_id: str, job_id: str) -> Optional[Tuple[str, str]]:
+    """
+    Close a complete session for import by `job_id`.
+    Returns its spool path and sha256, or None if the session is no longer
+    open or not fully received.
+    """
+    db = SessionLocal()
+    try:
+        session = db.get(UploadSession, session_id)
+        if session is None or session.status != "open":
+            return None
+        if session.size is not None and session.received != session.size:
+            return None
+        updated = db.query(UploadSession).filter(
+            UploadSession.id == session_id,
+            UploadSession.status == "open",
+            UploadSession.received == session.received
+        ).update({"status": "finalized", "job_id": job_id, "updated_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        if not updated:
+            return None
+        # Drop bytes written past the acknowledged offset by an interrupted chunk
+        os.truncate(session.spool_path, session.received)
+        _written.pop(session_id, None)
+        offset, digest = _digests.pop(session_id, (None, None))
+        checksum = digest.hexdigest() if offset == session.received else file_checksum(session.spool_path)
+        return session.spool_path, checksum
+    finally:
+        db.close()
+
+
+def abort_session(session_id: str) -> bool:
+    """Delete an open session and its spool file"""
+    db = SessionLocal()
+    try:
+        session = db.get(UploadSession, session_id)
+        if session is None or session.status != "open":
+            return False
+        spool_path = session.spool_path
+        db.delete(session)
+        db.commit()
+    finally:
+        db.close()
+    _digests.pop(session_id, None)
+    _written.pop(session_id, None)
+    if os.path.exists(spool_path):
+        os.remove(spool_path)
+    return True
+
+
+def cleanup_upload_sessions() -> int:
+    """Delete sessions untouched past their TTL (and abandoned spool files). Returns the number deleted."""
+    cutoff = datetime.utcnow() - timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS)
+    db = SessionLocal()
+    try:
+        expired = db.query(UploadSession).filter(UploadSession.updated_at < cutoff).all()
+        for session in expired:
+            _digests.pop(session.id, None)
+            _written.pop(session.id, None)
+            # Finalized spool files belong to their import, which deletes them
+            if session.status == "open" and os.path.exists(session.spool_path):
+                os.remove(session.spool_path)
+            db.delete(session)
+        db.commit()
+        return len(expired)
+    finally:
+        db.close()
@@ -1,55 +1,487 @@
 import aiohttp
 import asyncio
-from datetime import datetime
-from ..models import Webhook, EventType
-from ..database import SessionLocal
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+from sqlalchemy.orm import Session
+from ..models import Webhook, WebhookDelivery, EventType
+from ..database import SessionLocal, run_db
+from .counters import WEBHOOKS_VERSION, get_counter
+from .metrics import WEBHOOK_DELIVERIES, WEBHOOK_LATENCY
 
+# Total connections in the shared pool and concurrent deliveries per host
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+WEBHOOK_MAX_PER_HOST = int(os.getenv("WEBHOOK_MAX_PER_HOST", "10"))
+# Per-request timeout in seconds
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "5"))
+# Retry schedule: base * 2^(attempt-1) seconds, capped, until max attempts
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_RETRY_BASE = float(os.getenv("WEBHOOK_RETRY_BASE", "2"))
+WEBHOOK_RETRY_MAX = float(os.getenv("WEBHOOK_RETRY_MAX", "600"))
+# How often the outbox is polled for due deliveries (new local events wake it immediately)
+WEBHOOK_POLL_INTERVAL = float(os.getenv("WEBHOOK_POLL_INTERVAL", "2"))
+# Delivered/failed outbox rows are pruned after this many seconds
+WEBHOOK_OUTBOX_TTL = int(os.getenv("WEBHOOK_OUTBOX_TTL", "86400"))
 
-async def trigger_webhooks(
-    event_type: EventType,
-    product_data: dict,
-    timeout: int = 5
-) -> None:
+# Seconds between checks of the shared subscription version (local changes apply immediately)
+WEBHOOK_CACHE_CHECK_INTERVAL = float(os.getenv("WEBHOOK_CACHE_CHECK_INTERVAL", "2"))
+
+# Import batch events: max products per payload and max seconds a partial batch waits
+WEBHOOK_BATCH_MAX_ROWS = int(os.getenv("WEBHOOK_BATCH_MAX_ROWS", "1000"))
+WEBHOOK_BATCH_FLUSH_SECONDS = float(os.getenv("WEBHOOK_BATCH_FLUSH_SECONDS", "5"))
+
+# A claimed delivery is retried by any worker if not finished within this lease
+DELIVERY_LEASE_SECONDS = WEBHOOK_TIMEOUT + 30
+PRUNE_INTERVAL = 300
+
+
+def product_payload(product) -> dict:
+    """Product fields sent in webhook payloads"""
+    return {
+        "id": product.id,
+        "sku": product.sku,
+        "name": product.name,
+        "description": product.description,
+        "active": product.active
+    }
+
+
+class SubscriptionIndex:
     """
-    Trigger all enabled webhooks for a given event type.
-    Runs asynchronously without blocking.
-    Creates its own database session.
+    In-process copy of the enabled webhooks keyed by event type.
+    Webhook CRUD in this worker invalidates it directly; changes made by other
+    workers are noticed through the webhooks_version counter, which is checked
+    at most every WEBHOOK_CACHE_CHECK_INTERVAL seconds.
     """
-    # Create a new session for async operation
+
+    def __init__(self):
+        self._by_event: Optional[Dict[EventType, List[Tuple[int, str]]]] = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, db: Session) -> None:
+        version = get_counter(db, WEBHOOKS_VERSION)
+        by_event: Dict[EventType, List[Tuple[int, str]]] = {}
+        for webhook_id, url, event_type in db.query(Webhook.id, Webhook.url, Webhook.event_type).filter(
+            Webhook.enabled == True
+        ).order_by(Webhook.id):
+            by_event.setdefault(event_type, []).append((webhook_id, url))
+
+        with self._lock:
+            self._by_event = by_event
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._by_event = None
+
+    def get(self, db: Session, event_type: EventType) -> List[Tuple[int, str]]:
+        """(webhook_id, url) pairs subscribed to the event"""
+        now = time.monotonic()
+        with self._lock:
+            by_event, version, checked_at = self._by_event, self._version, self._checked_at
+
+        if by_event is None:
+            self.load(db)
+        elif now - checked_at >= WEBHOOK_CACHE_CHECK_INTERVAL:
+            if get_counter(db, WEBHOOKS_VERSION) != version:
+                self.load(db)
+            else:
+                with self._lock:
+                    self._checked_at = now
+
+        with self._lock:
+            return list((self._by_event or {}).get(event_type, ()))
+
+
+subscriptions = SubscriptionIndex()
+
+
+def load_subscriptions() -> None:
+    """Warm the subscription index (called at startup)"""
     db = SessionLocal()
     try:
-        webhooks = db.query(Webhook).filter(
-            Webhook.event_type == event_type,
-            Webhook.enabled == True
-        ).all()
+        subscriptions.load(db)
+    finally:
+        db.close()
+
+
+def _enqueue(db: Session, event_type: EventType, body: dict) -> int:
+    targets = subscriptions.get(db, event_type)
+    if not targets:
+        return 0
+
+    now = datetime.utcnow()
+    payload = json.dumps({
+        "event_type": event_type.value,
+        **body,
+        "timestamp": now.isoformat()
+    })
+    db.add_all([
+        WebhookDelivery(
+            webhook_id=webhook_id,
+            url=url,
+            event_type=event_type.value,
+            payload=payload,
+            status="pending",
+            attempts=0,
+            next_attempt_at=now,
+            created_at=now
+        )
+        for webhook_id, url in targets
+    ])
+    return len(targets)
+
+
+def enqueue_webhooks(db: Session, event_type: EventType, product_data: dict) -> int:
+    """
+    Add one outbox row per enabled webhook subscribed to the event.
+    Runs inside the caller's transaction, so the event is stored atomically
+    with the change that caused it. Call delivery_engine.notify() after commit.
+    Returns the number of deliveries queued.
+    """
+    return _enqueue(db, event_type, {"product": product_data})
+
+
+class WebhookBatcher:
+    """
+    Groups products written by a bulk operation into product_batch_created /
+    product_batch_updated events of at most max_rows products each. A partial
+    batch is sent once flush_interval seconds have passed since the last one,
+    so subscribers get a bounded number of requests per import.
+    """
+
+    EVENTS = {
+        "created": EventType.product_batch_created,
+        "updated": EventType.product_batch_updated
+    }
+
+    def __init__(
+        self,
+        job_id: str,
+        max_rows: int = WEBHOOK_BATCH_MAX_ROWS,
+        flush_interval: float = WEBHOOK_BATCH_FLUSH_SECONDS
+    ):
+        self.job_id = job_id
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.sequence = 0
+        self._pending: Dict[str, List[dict]] = {kind: [] for kind in self.EVENTS}
+        self._last_flush = time.monotonic()
+
+    def add(self, db: Session, written: Dict[str, List[Dict]]) -> int:
+        """
+        Collect the rows returned by upsert_products. Queues outbox rows in the
+        caller's transaction when a batch is full or due; returns how many.
+        """
+        for kind, event_type in self.EVENTS.items():
+            if written.get(kind) and subscriptions.get(db, event_type):
+                self._pending[kind].extend(
+                    {
+                        "id": row.get("id"),
+                        "sku": row["sku"],
+                        "name": row["name"],
+                        "description": row.get("description"),
+                        "active": row.get("active", True)
+                    }
+                    for row in written[kind]
+                )
+
+        full = any(len(rows) >= self.max_rows for rows in self._pending.values())
+        due = time.monotonic() - self._last_flush >= self.flush_interval
+        return self.flush(db, partial=due) if full or due else 0
+
+    def flush(self, db: Session, partial: bool = True) -> int:
+        """Queue full batches, and the remainder too unless partial is False"""
+        queued = 0
+        for kind, event_type in self.EVENTS.items():
+            rows = self._pending[kind]
+            while len(rows) >= self.max_rows or (partial and rows):
+                chunk, rows = rows[:self.max_rows], rows[self.max_rows:]
+                self.sequence += 1
+                queued += _enqueue(db, event_type, {
+                    "job_id": self.job_id,
+                    "batch": self.sequence,
+                    "count": len(chunk),
+                    "products": chunk
+                })
+            self._pending[kind] = rows
+        if partial:
+            self._last_flush = time.monotonic()
+        return queued
+
+    def snapshot(self) -> Tuple:
+        """State to restore() if the transaction of the following add() or flush() rolls back"""
+        return self.sequence, self._last_flush, {kind: list(rows) for kind, rows in self._pending.items()}
+
+    def restore(self, state: Tuple) -> None:
+        """
+        Return to a snapshot: rows of a rolled-back write are forgotten, and
+        rows whose outbox batch was rolled back are pending again.
+        """
+        self.sequence, self._last_flush, self._pending = state
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(WEBHOOK_RETRY_BASE * (2 ** (attempts - 1)), WEBHOOK_RETRY_MAX)
+    return delay * random.uniform(1.0, 1.1)
+
+
+def _claim_due(limit: int, host_free: Optional[Dict[str, int]] = None, busy_urls: Iterable[str] = ()) -> List[Dict]:
+    """
+    Lease up to limit due deliveries so no other worker sends them concurrently.
+    At most host_free[host] (default WEBHOOK_MAX_PER_HOST) are claimed per host,
+    so every claimed delivery can start sending right away and finish within
+    its lease; rows for the busy_urls (hosts with no free slot) are not read.
+    """
+    now = datetime.utcnow()
+    lease_until = now + timedelta(seconds=DELIVERY_LEASE_SECONDS)
+    host_free = dict(host_free or {})
+    busy_urls = list(busy_urls)
+    db = SessionLocal()
+    try:
+        query = db.query(WebhookDelivery).filter(
+            WebhookDelivery.status == "pending",
+            WebhookDelivery.next_attempt_at <= now
+        )
+        if busy_urls:
+            query = query.filter(WebhookDelivery.url.notin_(busy_urls))
+        due = query.order_by(WebhookDelivery.next_attempt_at, WebhookDelivery.id).limit(limit).all()
+
+        claimed = []
+        for delivery in due:
+            host = urlsplit(delivery.url).netloc
+            if host_free.get(host, WEBHOOK_MAX_PER_HOST) <= 0:
+                # Left for a later pass, when this host has a free slot
+                continue
+            updated = db.query(WebhookDelivery).filter(
+                WebhookDelivery.id == delivery.id,
+                WebhookDelivery.status == "pending",
+                WebhookDelivery.next_attempt_at == delivery.next_attempt_at
+            ).update({
+                "next_attempt_at": lease_until,
+                "attempts": WebhookDelivery.attempts + 1
+            }, synchronize_session=False)
+            if updated:
+                host_free[host] = host_free.get(host, WEBHOOK_MAX_PER_HOST) - 1
+                claimed.append({
+                    "id": delivery.id,
+                    "url": delivery.url,
+                    "payload": delivery.payload,
+                    "attempts": delivery.attempts + 1
+                })
+        db.commit()
+        return claimed
+    finally:
+        db.close()
+
+
+def _record_result(delivery_id: int, attempts: int, error: Optional[str]) -> None:
+    """Mark a delivery as delivered, schedule its retry, or give up"""
+    now = datetime.utcnow()
+    if error is None:
+        fields = {"status": "delivered", "last_error": None, "finished_at": now}
+    elif attempts >= WEBHOOK_MAX_ATTEMPTS:
+        fields = {"status": "failed", "last_error": error, "finished_at": now}
+    else:
+        fields = {
+            "last_error": error,
+            "next_attempt_at": now + timedelta(seconds=_retry_delay(attempts))
+        }
+    db = SessionLocal()
+    try:
+        db.query(WebhookDelivery).filter(WebhookDelivery.id == delivery_id).update(fields)
+        db.commit()
     finally:
         db.close()
-    
-    if not webhooks:
-        return
-    
-    async def send_webhook(webhook: Webhook):
+
+
+def _prune_outbox() -> None:
+    cutoff = datetime.utcnow() - timedelta(seconds=WEBHOOK_OUTBOX_TTL)
+    db = SessionLocal()
+    try:
+        db.query(WebhookDelivery).filter(
+            WebhookDelivery.status.in_(("delivered", "failed")),
+            WebhookDelivery.finished_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+class WebhookDeliveryEngine:
+    """
+    Long-lived sender for the webhook outbox.
+    Uses one pooled aiohttp session, bounds in-flight deliveries globally and
+    per host, and retries failures with exponential backoff. Pending rows are
+    picked up again after a restart, by whichever worker claims them first.
+    """
+
+    def __init__(self):
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: set = set()
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        # URLs of claimed, unfinished deliveries, counted per host
+        self._claimed: Dict[str, Dict[str, int]] = {}
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=WEBHOOK_MAX_CONNECTIONS,
+                limit_per_host=WEBHOOK_MAX_PER_HOST
+            ),
+            timeout=aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT)
+        )
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Unfinished deliveries keep their lease and are retried after restart
+        for task in list(self._in_flight):
+            task.cancel()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self.session:
+            await self.session.close()
+        self.session = None
+        self._task = None
+        self._loop = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def notify(self) -> None:
+        """Wake the sender after new outbox rows were committed. Safe from any thread."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wake.set()
+        else:
+            loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run(self) -> None:
+        last_prune = 0.0
+        while True:
+            try:
+                free_slots = WEBHOOK_MAX_CONNECTIONS - len(self._in_flight)
+                if free_slots > 0:
+                    host_free, busy_urls = self._host_slots()
+                    for delivery in await run_db(_claim_due, free_slots, host_free, busy_urls):
+                        self._hold(delivery["url"])
+                        task = asyncio.create_task(self._deliver(delivery))
+                        self._in_flight.add(task)
+                        task.add_done_callback(self._in_flight.discard)
+
+                if self._loop.time() - last_prune > PRUNE_INTERVAL:
+                    await run_db(_prune_outbox)
+                    last_prune = self._loop.time()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Database may be locked by an import; retry on the next cycle
+                pass
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=WEBHOOK_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _host_slots(self) -> Tuple[Dict[str, int], List[str]]:
+        """Free delivery slots of hosts with claimed deliveries, and the URLs of hosts that have none"""
+        host_free = {}
+        busy_urls = []
+        for host, urls in self._claimed.items():
+            host_free[host] = WEBHOOK_MAX_PER_HOST - sum(urls.values())
+            if host_free[host] <= 0:
+                busy_urls.extend(urls)
+        return host_free, busy_urls
+
+    def _hold(self, url: str) -> None:
+        urls = self._claimed.setdefault(urlsplit(url).netloc, {})
+        urls[url] = urls.get(url, 0) + 1
+
+    def _release(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        urls = self._claimed.get(host, {})
+        urls[url] -= 1
+        if not urls[url]:
+            del urls[url]
+        if not urls:
+            self._claimed.pop(host, None)
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(WEBHOOK_MAX_PER_HOST)
+        return self._host_limits[host]
+
+    async def _deliver(self, delivery: Dict) -> None:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    webhook.url,
-                    json={
-                        "event_type": event_type.value,
-                        "product": product_data,
-                        "timestamp": datetime.utcnow().isoformat()
-                    },
-                    timeout=aiohttp.ClientTimeout(total=timeout)
-                ) as response:
-                    # Webhook sent (we don't wait for response in production)
-                    pass
+            await self._send(delivery)
+        finally:
+            self._release(delivery["url"])
+        # A finished delivery frees a slot for more due rows
+        self._wake.set()
+
+    async def _send(self, delivery: Dict) -> None:
+        error = None
+        outcome = "success"
+        host = urlsplit(delivery["url"]).netloc
+        try:
+            async with self._host_limit(delivery["url"]):
+                started = time.perf_counter()
+                try:
+                    async with self.session.post(
+                        delivery["url"],
+                        data=delivery["payload"],
+                        headers={"Content-Type": "application/json"}
+                    ) as response:
+                        if response.status >= 300:
+                            error = f"HTTP {response.status}"
+                            outcome = "http_error"
+                finally:
+                    WEBHOOK_LATENCY.observe(time.perf_counter() - started, host)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            error = "Request timeout"
+            outcome = "timeout"
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            outcome = "error"
+        WEBHOOK_DELIVERIES.inc(1, host, outcome)
+
+        try:
+            await run_db(_record_result, delivery["id"], delivery["attempts"], error)
         except Exception:
-            # Silently fail for background webhooks
+            # Lease expires and the delivery is retried
             pass
-    
-    # Trigger all webhooks concurrently
-    tasks = [send_webhook(webhook) for webhook in webhooks]
-    # Create background task - fire and forget
-    asyncio.create_task(asyncio.gather(*tasks, return_exceptions=True))
+
+
+delivery_engine = WebhookDeliveryEngine()
 
 
 async def test_webhook(webhook: Webhook, timeout: int = 10) -> dict:
@@ -58,9 +490,13 @@ async def test_webhook(webhook: Webhook, timeout: int = 10) -> dict:
     Used for the test endpoint.
     """
     start_time = datetime.utcnow()
-    
+
     try:
-        async with aiohttp.ClientSession() as session:
+        session = delivery_engine.session
+        owns_session = session is None
+        if owns_session:
+            session = aiohttp.ClientSession()
+        try:
             async with session.post(
                 webhook.url,
                 json={
@@ -72,12 +508,15 @@ async def test_webhook(webhook: Webhook, timeout: int = 10) -> dict:
             ) as response:
                 end_time = datetime.utcnow()
                 response_time = (end_time - start_time).total_seconds() * 1000
-                
+
                 return {
                     "success": True,
                     "status_code": response.status,
                     "response_time_ms": round(response_time, 2)
                 }
+        finally:
+            if owns_session:
+                await session.close()
     except asyncio.TimeoutError:
         return {
             "success": False,
@@ -86,10 +525,9 @@ async def test_webhook(webhook: Webhook, timeout: int = 10) -> dict:
     except Exception as e:
         end_time = datetime.utcnow()
         response_time = (end_time - start_time).total_seconds() * 1000
-        
+
         return {
             "success": False,
             "error": str(e),
             "response_time_ms": round(response_time, 2) if 'response_time' in locals() else None
         }
-
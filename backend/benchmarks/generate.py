@@ -0,0 +1,102 @@
+"""
+Deterministic synthetic product CSV generator.
+
+    python -m benchmarks.generate products.csv --rows 500000
+
+The same arguments always produce the same bytes, so results from different
+machines or commits are comparable.
+"""
+import argparse
+import csv
+import random
+import string
+from typing import Dict
+
+WORDS = (
+    "steel", "oak", "compact", "deluxe", "wireless", "organic", "classic", "pro",
+    "mini", "ultra", "eco", "smart", "vintage", "rugged", "portable", "premium",
+    "cable", "lamp", "chair", "bottle", "kettle", "speaker", "backpack", "drill",
+    "blender", "jacket", "monitor", "router", "candle", "notebook", "helmet", "tent"
+)
+
+
+def _description(rng: random.Random, length: int) -> str:
+    """About length characters of words; some contain commas, quotes and newlines"""
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    text = " ".join(words)[:length]
+    roll = rng.random()
+    if roll < 0.05:
+        text = text.replace(" ", ", ", 1)
+    elif roll < 0.07:
+        text = f'{text} "limited"'
+    elif roll < 0.08:
+        text = text.replace(" ", "\n", 1)
+    return text
+
+
+def generate_csv(
+    path: str,
+    rows: int,
+    duplicate_ratio: float = 0.05,
+    case_collision_ratio: float = 0.02,
+    description_length: int = 80,
+    seed: int = 42
+) -> Dict[str, int]:
+    """
+    Write a products CSV and return how many rows of each kind it contains.
+    duplicate_ratio of the rows repeat an earlier SKU exactly and
+    case_collision_ratio repeat one in different case (both update a product).
+    """
+    rng = random.Random(seed)
+    stats = {"rows": rows, "unique_skus": 0, "duplicates": 0, "case_collisions": 0}
+    issued = []
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["sku", "name", "description"])
+        for _ in range(rows):
+            roll = rng.random()
+            if issued and roll < duplicate_ratio:
+                sku = rng.choice(issued)
+                stats["duplicates"] += 1
+            elif issued and roll < duplicate_ratio + case_collision_ratio:
+                sku = rng.choice(issued).swapcase()
+                stats["case_collisions"] += 1
+            else:
+                suffix = "".join(rng.choices(string.ascii_uppercase, k=3))
+                sku = f"SKU-{len(issued):07d}-{suffix}"
+                issued.append(sku)
+                stats["unique_skus"] += 1
+            name = " ".join(rng.choice(WORDS).title() for _ in range(3))
+            writer.writerow([sku, name, _description(rng, description_length)])
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic products CSV")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--case-collision-ratio", type=float, default=0.02)
+    parser.add_argument("--description-length", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    stats = generate_csv(
+        args.path,
+        args.rows,
+        duplicate_ratio=args.duplicate_ratio,
+        case_collision_ratio=args.case_collision_ratio,
+        description_length=args.description_length,
+        seed=args.seed
+    )
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
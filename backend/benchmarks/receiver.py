@@ -0,0 +1,82 @@
+"""
+Local stand-in for webhook subscribers.
+
+Accepts POSTs on any path, counts requests and products, and can add a fixed
+delay or fail a share of requests to mimic slow or flaky endpoints.
+
+    python -m benchmarks.receiver --port 9100 --delay 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import Optional
+from aiohttp import web
+
+
+class WebhookReceiver:
+    def __init__(self, delay: float = 0.0, failure_rate: float = 0.0, seed: int = 42):
+        self.delay = delay
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.failures = 0
+        self.products = 0
+        self._rng = random.Random(seed)
+        self._runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.requests += 1
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            self.failures += 1
+            return web.Response(status=503)
+        payload = json.loads(body)
+        self.products += payload.get("count", 1)
+        return web.Response(status=204)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post("/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}/hook"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(args) -> None:
+    receiver = WebhookReceiver(delay=args.delay, failure_rate=args.failure_rate)
+    url = await receiver.start(port=args.port)
+    print(f"Receiving webhooks at {url}")
+    try:
+        while True:
+            await asyncio.sleep(5)
+            print(f"requests={receiver.requests} failures={receiver.failures} products={receiver.products}")
+    finally:
+        await receiver.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a local webhook receiver")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
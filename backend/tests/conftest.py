@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+import pytest
+
+# Tests run against a scratch SQLite database unless DATABASE_URL names a PostgreSQL one
+if not os.getenv("DATABASE_URL", "").startswith("postgresql"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+
+import app.main  # noqa: E402,F401 - creates the schema
+from app.database import SessionLocal  # noqa: E402
+from app.models import Counter, Product, Webhook, WebhookDelivery  # noqa: E402
+from app.services.catalogue_stats import reset_stats  # noqa: E402
+from app.services.webhook_service import subscriptions  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A session on an empty catalogue"""
+    session = SessionLocal()
+    for model in (Product, WebhookDelivery, Webhook, Counter):
+        session.query(model).delete()
+    reset_stats(session)
+    session.commit()
+    subscriptions.invalidate()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
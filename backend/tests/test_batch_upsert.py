@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from app.models import EventType, Product, Webhook, WebhookDelivery
+from app.services import batch_upsert
+from app.services.batch_upsert import BatchWriter
+from app.services.webhook_service import WebhookBatcher
+
+
+@pytest.fixture
+def subscribed(db):
+    db.add(Webhook(url="http://hooks.test/batch", event_type=EventType.product_batch_created, enabled=True))
+    db.commit()
+    return db
+
+
+def announced(db):
+    """(batch, skus) of every product_batch_created event in the outbox"""
+    bodies = [json.loads(payload) for (payload,) in db.query(WebhookDelivery.payload)]
+    return sorted((body["batch"], [product["sku"] for product in body["products"]]) for body in bodies)
+
+
+def test_failed_chunk_is_not_announced(subscribed, monkeypatch):
+    db = subscribed
+    writer = BatchWriter(db, "batch-1", chunk_size=2)
+    writer.webhooks = WebhookBatcher("batch-1", max_rows=3, flush_interval=3600)
+
+    writer.add({"sku": "A-1", "name": "First"})
+    writer.add({"sku": "A-2", "name": "Second"})
+    writer.write()
+    assert announced(db) == []
+
+    # The second chunk fills a webhook batch, then its transaction fails
+    writer.add({"sku": "B-1", "name": "Third"})
+    writer.add({"sku": "B-2", "name": "Fourth"})
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(batch_upsert, "bump_counter", fail)
+        writer.write()
+
+    assert [result["status"] for result in writer.results] == ["created", "created", "error", "error"]
+    assert announced(db) == []
+
+    summary = writer.finish()
+    assert summary["created"] == 2 and summary["failed"] == 2
+    assert sorted(sku for (sku,) in db.query(Product.sku)) == ["A-1", "A-2"]
+    # The batch of the first chunk survives the rollback, with the sequence it would have had
+    assert announced(db) == [(1, ["A-1", "A-2"])]
+
@@ -0,0 +1,64 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import parallel_import
+from app.services.bulk_delete import reclaim_trash, swap_out_products
+from app.services.catalogue_stats import _count_products, get_stats
+from app.services.counters import CATALOGUE_GENERATION, get_counter
+from app.services.csv_processor import process_csv_file
+from app.services.job_store import create_job, create_job_id
+
+
+def assert_stats_match(db):
+    """The maintained counters agree with a full count of the table"""
+    db.rollback()
+    counted = _count_products(db)
+    assert get_stats(db) == {
+        "total": counted["products_total"],
+        "active": counted["products_active"],
+        "inactive": counted["products_total"] - counted["products_active"]
+    }
+
+
+def import_file(db, tmp_path, name, skus, workers=None):
+    path = tmp_path / name
+    path.write_text("sku,name,description\n" + "".join(f'{sku},Product {sku},"line one\nline two"\n' for sku in skus))
+    job_id = create_job_id()
+    create_job(job_id)
+    process_csv_file(str(path), db, job_id, workers=workers, force=True)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_counters_follow_imports_and_bulk_delete(db, tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(parallel_import, "PARALLEL_MIN_BYTES", 0)
+    monkeypatch.setattr(parallel_import, "PARALLEL_RANGE_BYTES", 512)
+    client = TestClient(app)
+
+    import_file(db, tmp_path, "first.csv", [f"SKU-{i}" for i in range(300)], workers)
+    assert get_stats(db)["total"] == 300
+    assert_stats_match(db)
+
+    # Deactivate a few through the API, then re-import a file that overlaps and reactivates them
+    product_ids = [product["id"] for product in client.get("/api/products", params={"page_size": 5}).json()["items"]]
+    for product_id in product_ids:
+        assert client.put(f"/api/products/{product_id}", json={"active": False}).status_code == 200
+    assert get_stats(db)["inactive"] == 5
+    assert_stats_match(db)
+
+    import_file(db, tmp_path, "second.csv", [f"sku-{i}" for i in range(200, 400)], workers)
+    assert get_stats(db) == {"total": 400, "active": 395, "inactive": 5}
+    assert_stats_match(db)
+
+    generation = get_counter(db, CATALOGUE_GENERATION)
+    db.rollback()
+    suffix = swap_out_products()
+    if suffix:
+        reclaim_trash(suffix)
+    assert get_stats(db) == {"total": 0, "active": 0, "inactive": 0}
+    assert get_counter(db, CATALOGUE_GENERATION) > generation
+    assert_stats_match(db)
+
+    import_file(db, tmp_path, "third.csv", [f"SKU-{i}" for i in range(50)], workers)
+    assert get_stats(db)["total"] == 50
+    assert_stats_match(db)
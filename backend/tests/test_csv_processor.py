@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from app.models import EventType, Product, Webhook, WebhookDelivery
+from app.services import csv_processor
+from app.services.csv_processor import process_csv_file
+from app.services.job_store import create_job, get_job
+
+
+def write_csv(path, skus):
+    path.write_text("sku,name,description\n" + "".join(f"{sku},Product {sku},\n" for sku in skus))
+    return str(path)
+
+
+def test_failed_import_announces_committed_batches(db, tmp_path, monkeypatch):
+    db.add(Webhook(url="http://hooks.test/import", event_type=EventType.product_batch_created, enabled=True))
+    db.commit()
+    monkeypatch.setattr(csv_processor, "BATCH_SIZE", 2)
+    calls = []
+
+    def bump_once(*args):
+        calls.append(args)
+        if len(calls) > 1:
+            raise RuntimeError("disk full")
+
+    monkeypatch.setattr(csv_processor, "bump_counter", bump_once)
+    create_job("failed-import")
+
+    with pytest.raises(RuntimeError):
+        process_csv_file(write_csv(tmp_path / "a.csv", ["A-1", "A-2", "B-1", "B-2"]), db, "failed-import")
+
+    assert get_job("failed-import")["status"] == "error"
+    assert sorted(sku for (sku,) in db.query(Product.sku)) == ["A-1", "A-2"]
+    bodies = [json.loads(payload) for (payload,) in db.query(WebhookDelivery.payload)]
+    assert [[product["sku"] for product in body["products"]] for body in bodies] == [["A-1", "A-2"]]
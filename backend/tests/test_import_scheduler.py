@@ -0,0 +1,40 @@
+import pytest
+
+from app.services import import_scheduler as scheduler_module
+from app.services.import_scheduler import ImportScheduler
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """A scheduler whose workers never start an import; job store writes are recorded"""
+    writes = []
+    monkeypatch.setattr(scheduler_module, "update_job", lambda job_id, **fields: writes.append((job_id, fields["message"])))
+    scheduler = ImportScheduler(concurrency=1)
+    scheduler._stopping = True
+    scheduler.writes = writes
+    return scheduler
+
+
+def test_only_changed_positions_are_written(scheduler, tmp_path):
+    for job_id in ("a", "b", "c"):
+        scheduler.submit(job_id, str(tmp_path / job_id))
+    assert scheduler.writes == [("a", "Queued (position 1)"), ("b", "Queued (position 2)"), ("c", "Queued (position 3)")]
+
+    scheduler.writes.clear()
+    scheduler.submit("urgent", str(tmp_path / "urgent"), priority=5)
+    assert scheduler.writes == [
+        ("urgent", "Queued (position 1)"), ("a", "Queued (position 2)"),
+        ("b", "Queued (position 3)"), ("c", "Queued (position 4)")
+    ]
+
+    scheduler.writes.clear()
+    scheduler.cancel("c")
+    assert scheduler.writes == [("c", "Import cancelled before it started.")]
+
+
+def test_heartbeat_refreshes_every_queued_job(scheduler, tmp_path):
+    for job_id in ("a", "b"):
+        scheduler.submit(job_id, str(tmp_path / job_id))
+    scheduler.writes.clear()
+    scheduler.heartbeat()
+    assert scheduler.writes == [("a", "Queued (position 1)"), ("b", "Queued (position 2)")]
@@ -0,0 +1,80 @@
+import pytest
+
+from app.database import engine
+from app.models import Product
+from app.services import ingest
+from app.services.catalogue_stats import get_stats
+from app.services.counters import bump_counter, get_counter, set_counter
+from app.services.product_upsert import upsert_products
+
+on_postgres = pytest.mark.skipif(
+    engine.dialect.name != "postgresql", reason="set DATABASE_URL to a PostgreSQL database"
+)
+
+# Characters the COPY text format has to escape
+AWKWARD = "tab\there, new\nline, back\\slash and \\N"
+
+
+@pytest.fixture(params=["native", "portable"])
+def write_path(request, monkeypatch):
+    """Runs a test on the dialect's own ingest backend and on the portable fallback"""
+    if request.param == "portable":
+        monkeypatch.setattr(ingest, "_BACKENDS", {})
+    return request.param
+
+
+def stored(db):
+    return {
+        product.sku: (product.id, product.name, product.description, product.active)
+        for product in db.query(Product)
+    }
+
+
+def test_upsert_classifies_rows_and_returns_ids(db, write_path):
+    first = upsert_products(db, [
+        {"sku": "A-1", "name": "One", "description": AWKWARD, "active": True},
+        {"sku": "B-1", "name": "Two", "description": None, "active": False}
+    ])
+    db.commit()
+    products = stored(db)
+    assert products["A-1"][1:] == ("One", AWKWARD, True)
+    assert products["B-1"][1:] == ("Two", None, False)
+    assert [row["id"] for row in first["created"]] == [products["A-1"][0], products["B-1"][0]]
+
+    second = upsert_products(db, [
+        {"sku": "a-1", "name": "One, renamed", "description": AWKWARD, "active": False},
+        {"sku": "B-1", "name": "Two", "description": None, "active": False},
+        {"sku": "C-1", "name": "Three", "description": "", "active": True}
+    ])
+    db.commit()
+    products = stored(db)
+    assert [row["sku_normalized"] for row in second["updated"]] == ["a-1"]
+    assert [row["sku_normalized"] for row in second["unchanged"]] == ["b-1"]
+    assert [row["sku_normalized"] for row in second["created"]] == ["c-1"]
+    # The stored casing is kept, and every row carries its product id
+    assert products["A-1"][1:] == ("One, renamed", AWKWARD, False)
+    assert [row["id"] for kind in ("updated", "unchanged", "created") for row in second[kind]] == [
+        products["A-1"][0], products["B-1"][0], products["C-1"][0]
+    ]
+    assert get_stats(db) == {"total": 3, "active": 1, "inactive": 2}
+
+
+def test_counters_upsert(db):
+    bump_counter(db, "test_counter")
+    bump_counter(db, "test_counter", 4)
+    db.commit()
+    assert get_counter(db, "test_counter") == 5
+    set_counter(db, "test_counter", 2)
+    set_counter(db, "other_counter", 7)
+    db.commit()
+    assert (get_counter(db, "test_counter"), get_counter(db, "other_counter")) == (2, 7)
+
+
+@on_postgres
+def test_postgres_imports_through_copy(db):
+    assert isinstance(ingest.ingest_backend(db.connection().dialect.name), ingest.PostgresIngest)
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        assert hasattr(cursor, "copy") or hasattr(cursor, "copy_expert"), "psycopg or psycopg2 driver expected"
+    finally:
+        cursor.close()
@@ -0,0 +1,34 @@
+import logging
+import threading
+
+from fastapi.testclient import TestClient
+
+from app import main
+
+
+def test_failed_startup_reclaim_is_logged(db, monkeypatch, caplog):
+    def reclaim(suffix, job_id, stop):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(main, "reclaim_trash", reclaim)
+    with caplog.at_level(logging.ERROR, logger="app.main"):
+        with TestClient(main.app):
+            pass
+
+    assert any(record.exc_info and "database is locked" in str(record.exc_info[1]) for record in caplog.records)
+
+
+def test_shutdown_stops_and_waits_for_reclaim(db, monkeypatch):
+    started, finished = threading.Event(), threading.Event()
+
+    def reclaim(suffix, job_id, stop):
+        started.set()
+        # Works until asked to stop, like reclaim_trash between chunks
+        stop.wait(10)
+        finished.set()
+
+    monkeypatch.setattr(main, "reclaim_trash", reclaim)
+    with TestClient(main.app):
+        assert started.wait(5)
+        assert not finished.is_set()
+    assert finished.is_set()
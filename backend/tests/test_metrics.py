@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.metrics import REQUEST_LATENCY
+
+
+def routes():
+    return {labels[1] for labels in REQUEST_LATENCY._series}
+
+
+def test_latency_is_labelled_by_route_template(db):
+    client = TestClient(app)
+    client.get("/api/products")
+    # A path parameter equal to another segment of the path must not be mistaken for it
+    client.get("/api/products/products")
+    client.get("/api/products/12345")
+    client.get("/api/webhooks/12345")
+    client.get("/no/such/route")
+
+    assert {"/api/products", "/api/products/{product_id}", "/api/webhooks/{webhook_id}", "unmatched"} <= routes()
+    assert not any("12345" in route or "/products/products" in route for route in routes())
@@ -0,0 +1,96 @@
+import pytest
+
+from app.services import parallel_import
+from app.services.csv_parsing import find_record_boundaries, iter_record_batches, parse_range, read_header
+
+ROWS = [
+    'sku,name,description\r\n',
+    'P-1,Pizza,12" pizza\r\n',
+    'P-2,"Pizza, large","Serves 4\nto 6 people"\n',
+    'P-3,Box,"She said ""hi""\nand left"\n',
+    'P-4,"Oven" door,"""quoted"" start"\n',
+    'P-5,Tray,16" x 12"\n',
+    'P-6,Lid,"multi\n\nline, with ""quotes"" and 3"""\n',
+    'P-7,Peel,"odd "quote" inside"\n',
+    ',missing sku,\n',
+    'P-8,Cutter,"ends without newline"',
+]
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "products.csv"
+    # Repeat the rows so ranges land in every kind of record
+    body = "".join(ROWS[1:-1]) * 20 + ROWS[-1]
+    path.write_bytes((ROWS[0] + body).encode("utf-8"))
+    return str(path)
+
+
+def serial_rows(file_path):
+    index, data_start = read_header(file_path)
+    rows, invalid = [], 0
+    for batch, _, skipped in iter_record_batches(file_path, index, data_start, 7):
+        rows.extend(batch)
+        invalid += skipped
+    return rows, invalid
+
+
+@pytest.mark.parametrize("step", [1, 2, 5, 13, 64, 250])
+def test_ranges_parse_like_the_whole_file(csv_file, step):
+    index, data_start = read_header(csv_file)
+    boundaries = find_record_boundaries(csv_file, data_start, step)
+
+    rows, invalid = [], 0
+    for start, end in zip(boundaries, boundaries[1:]):
+        range_rows, range_invalid, complete = parse_range(csv_file, start, end, index)
+        assert complete, (start, end)
+        rows.extend(range_rows)
+        invalid += range_invalid
+
+    assert (rows, invalid) == serial_rows(csv_file)
+
+
+def test_stray_quote_does_not_swallow_records(csv_file):
+    rows, _ = serial_rows(csv_file)
+    assert ("P-1", "Pizza", '12" pizza') in rows
+    assert ("P-2", "Pizza, large", "Serves 4\nto 6 people") in rows
+    assert len([row for row in rows if row[0] == "P-2"]) == 20
+
+
+def test_range_ending_inside_a_quoted_field_is_incomplete(csv_file):
+    index, data_start = read_header(csv_file)
+    with open(csv_file, "rb") as f:
+        content = f.read()
+    # Just past the quoted newline of P-2's description
+    end = content.index(b"Serves 4\n") + len(b"Serves 4\n")
+    _, _, complete = parse_range(csv_file, data_start, end, index)
+    assert not complete
+
+
+def test_parallel_batches_match_serial(csv_file, monkeypatch):
+    monkeypatch.setattr(parallel_import, "PARALLEL_RANGE_BYTES", 97)
+    index, data_start = read_header(csv_file)
+    rows, invalid = [], 0
+    for batch, _, skipped in parallel_import.iter_parallel_batches(csv_file, index, data_start, 2, 7):
+        rows.extend(batch)
+        invalid += skipped
+
+    assert (rows, invalid) == serial_rows(csv_file)
+
+
+def test_incomplete_range_falls_back_to_serial(csv_file, monkeypatch):
+    index, data_start = read_header(csv_file)
+    with open(csv_file, "rb") as f:
+        content = f.read()
+    cut = content.index(b"Serves 4\n") + len(b"Serves 4\n")
+    # Boundaries that split a quoted field, as a wrong scan would
+    monkeypatch.setattr(
+        parallel_import, "iter_record_boundaries",
+        lambda file_path, start, step: iter([start, cut, len(content)])
+    )
+    rows, invalid = [], 0
+    for batch, _, skipped in parallel_import.iter_parallel_batches(csv_file, index, data_start, 2, 7):
+        rows.extend(batch)
+        invalid += skipped
+
+    assert (rows, invalid) == serial_rows(csv_file)
@@ -0,0 +1,70 @@
+import asyncio
+import hashlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services import import_history, upload_sessions
+from app.services.import_scheduler import import_scheduler
+
+CONTENT = b"sku,name,description\n" + b"".join(b"SKU-%d,Product %d,\n" % (i, i) for i in range(200))
+
+
+@pytest.fixture
+def submitted(monkeypatch, tmp_path):
+    """Checksums handed to the scheduler; imports are not run"""
+    calls = []
+    monkeypatch.setattr(import_scheduler, "submit", lambda job_id, file_path, *args: calls.append(args[-1]) or 1)
+    monkeypatch.setattr(upload_sessions, "UPLOAD_SPOOL_DIR", str(tmp_path))
+
+    def rehash(file_path):
+        raise AssertionError("the upload was hashed again")
+
+    monkeypatch.setattr(upload_sessions, "file_checksum", rehash)
+    monkeypatch.setattr(import_history, "file_checksum", rehash)
+    return calls
+
+
+def test_upload_passes_checksum(db, submitted):
+    response = TestClient(app).post("/api/upload", files={"file": ("products.csv", CONTENT, "text/csv")})
+    assert response.status_code == 200
+    assert submitted == [hashlib.sha256(CONTENT).hexdigest()]
+
+
+def test_chunked_upload_passes_checksum(db, submitted):
+    client = TestClient(app)
+    upload_id = client.post("/api/upload/sessions", json={"filename": "products.csv", "size": len(CONTENT)}).json()["upload_id"]
+    for start in range(0, len(CONTENT), 1000):
+        chunk = CONTENT[start:start + 1000]
+        response = client.put(
+            f"/api/upload/sessions/{upload_id}",
+            content=chunk,
+            headers={"Content-Range": f"bytes {start}-{start + len(chunk) - 1}/{len(CONTENT)}"}
+        )
+        assert response.status_code == 200, response.text
+
+    assert client.post(f"/api/upload/sessions/{upload_id}/finalize").status_code == 200
+    assert submitted == [hashlib.sha256(CONTENT).hexdigest()]
+
+
+
+def test_checksum_survives_a_partly_acknowledged_chunk(db, submitted):
+    session = upload_sessions.create_session("products.csv", len(CONTENT))
+    upload_id = session["upload_id"]
+
+    async def body(*parts):
+        for part in parts:
+            yield part
+
+    # The body runs past its range: the part stored before that is acknowledged
+    with pytest.raises(upload_sessions.ChunkInterrupted) as interrupted:
+        asyncio.run(upload_sessions.write_chunk(upload_id, 0, 1500, body(CONTENT[:1000], CONTENT[1000:2000])))
+    assert interrupted.value.written == 1000
+    upload_sessions.acknowledge(upload_id, 0, 1000)
+
+    written = asyncio.run(upload_sessions.write_chunk(upload_id, 1000, len(CONTENT), body(CONTENT[1000:])))
+    upload_sessions.acknowledge(upload_id, 1000, 1000 + written)
+
+    _, checksum = upload_sessions.finalize_session(upload_id, "chunked-job")
+    assert checksum == hashlib.sha256(CONTENT).hexdigest()
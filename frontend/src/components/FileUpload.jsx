@@ -1,6 +1,20 @@
 import { useState, useRef } from 'react';
 import { uploadAPI } from '../services/api';
 
+// Plain or compressed CSV files accepted by the importer
+const ACCEPTED_EXTENSIONS = ['.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.zip'];
+
+// Failed chunks are retried this many times before the upload gives up
+const CHUNK_RETRIES = 5;
+
+// Remembers unfinished upload sessions so a reload can resume them
+const sessionKey = (file) => `upload-session:${file.name}:${file.size}:${file.lastModified}`;
+
+const errorDetail = (error, fallback) => {
+  const detail = error.response?.data?.detail;
+  return (typeof detail === 'object' ? detail?.message : detail) || fallback;
+};
+
 function FileUpload({ onUploadComplete }) {
   const [file, setFile] = useState(null);
   const [uploading, setUploading] = useState(false);
@@ -9,15 +23,16 @@ function FileUpload({ onUploadComplete }) {
   const [error, setError] = useState(null);
   const [success, setSuccess] = useState(false);
   const [isDragging, setIsDragging] = useState(false);
+  const [jobId, setJobId] = useState(null);
   const fileInputRef = useRef(null);
 
   const handleFileSelect = (selectedFile) => {
-    if (selectedFile && selectedFile.type === 'text/csv') {
+    if (selectedFile && ACCEPTED_EXTENSIONS.some((ext) => selectedFile.name.toLowerCase().endsWith(ext))) {
       setFile(selectedFile);
       setError(null);
       setSuccess(false);
     } else {
-      setError('Please select a valid CSV file');
+      setError('Please select a CSV file (optionally .gz, .bz2, .xz or .zip compressed)');
     }
   };
 
@@ -68,6 +83,12 @@ function FileUpload({ onUploadComplete }) {
           setError(data.message || 'Upload failed');
           setUploading(false);
           eventSource.close();
+        } else if (data.status === 'cancelled') {
+          setUploading(false);
+          eventSource.close();
+          if (onUploadComplete) {
+            onUploadComplete();
+          }
         }
       } catch (e) {
         // Ignore parse errors
@@ -81,6 +102,51 @@ function FileUpload({ onUploadComplete }) {
     };
   };
 
+  const openSession = async (file) => {
+    const savedId = localStorage.getItem(sessionKey(file));
+    if (savedId) {
+      try {
+        const { data } = await uploadAPI.getSession(savedId);
+        if (data.status === 'open') {
+          return data;
+        }
+      } catch (error) {
+        // Expired or unknown; start over
+      }
+    }
+    const { data } = await uploadAPI.createSession(file);
+    localStorage.setItem(sessionKey(file), data.upload_id);
+    return data;
+  };
+
+  const sendChunks = async (file, session) => {
+    let offset = session.offset;
+    let failures = 0;
+    while (offset < file.size) {
+      const end = Math.min(offset + session.chunk_size, file.size);
+      try {
+        const { data } = await uploadAPI.uploadChunk(session.upload_id, file, offset, end);
+        offset = data.offset;
+        failures = 0;
+        setProgress((offset / file.size) * 100);
+        setStatus(`Uploading file... ${(offset / 1024 / 1024).toFixed(1)} of ${(file.size / 1024 / 1024).toFixed(1)} MB`);
+      } catch (error) {
+        failures += 1;
+        if (failures > CHUNK_RETRIES || (error.response && error.response.status < 500 && error.response.status !== 409)) {
+          throw error;
+        }
+        setStatus('Connection interrupted, resuming upload...');
+        await new Promise((resolve) => setTimeout(resolve, Math.min(1000 * 2 ** failures, 15000)));
+        // Continue from what the server acknowledged
+        try {
+          offset = (await uploadAPI.getSession(session.upload_id)).data.offset;
+        } catch (lookupError) {
+          // Still offline; the next attempt will tell
+        }
+      }
+    }
+  };
+
   const handleUpload = async () => {
     if (!file) {
       setError('Please select a file first');
@@ -88,23 +154,38 @@ function FileUpload({ onUploadComplete }) {
     }
 
     setUploading(true);
+    setJobId(null);
     setError(null);
     setSuccess(false);
     setProgress(0);
     setStatus('Uploading file...');
 
     try {
-      const response = await uploadAPI.upload(file);
-      const { job_id } = response.data;
+      const session = await openSession(file);
+      await sendChunks(file, session);
+      const response = await uploadAPI.finalize(session.upload_id);
+      localStorage.removeItem(sessionKey(file));
+      const { job_id, message } = response.data;
 
-      setStatus('Processing CSV...');
+      setProgress(0);
+      setJobId(job_id);
+      setStatus(message || 'Processing CSV...');
       connectToProgressStream(job_id);
     } catch (error) {
-      setError(error.response?.data?.detail || 'Upload failed. Please try again.');
+      setError(errorDetail(error, 'Upload failed. Please try again.'));
       setUploading(false);
     }
   };
 
+  const handleCancel = async () => {
+    try {
+      await uploadAPI.cancel(jobId);
+      setStatus('Cancelling...');
+    } catch (error) {
+      // The import may have finished in the meantime
+    }
+  };
+
   const handleRetry = () => {
     setError(null);
     setSuccess(false);
@@ -120,7 +201,7 @@ function FileUpload({ onUploadComplete }) {
     <div className="upload-container">
       <h2>Upload CSV File</h2>
       <p style={{ marginBottom: '1.5rem', color: '#555' }}>
-        Upload a CSV file with up to 500,000 products. Duplicate SKUs will be overwritten.
+        Upload a CSV file with up to 500,000 products, plain or compressed (.gz, .bz2, .xz, .zip). Duplicate SKUs will be overwritten.
       </p>
 
       <div
@@ -133,7 +214,7 @@ function FileUpload({ onUploadComplete }) {
         <input
           ref={fileInputRef}
           type="file"
-          accept=".csv"
+          accept={ACCEPTED_EXTENSIONS.join(',')}
           onChange={handleFileInputChange}
           disabled={uploading}
         />
@@ -174,6 +255,15 @@ function FileUpload({ onUploadComplete }) {
             </div>
           </div>
           {status && <div className="progress-status">{status}</div>}
+          {uploading && jobId && (
+            <button
+              className="btn btn-danger"
+              onClick={handleCancel}
+              style={{ marginTop: '0.5rem' }}
+            >
+              Cancel Import
+            </button>
+          )}
         </div>
       )}
 
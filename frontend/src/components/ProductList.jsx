@@ -9,6 +9,7 @@ function ProductList() {
   const [pageSize, setPageSize] = useState(50);
   const [total, setTotal] = useState(0);
   const [totalPages, setTotalPages] = useState(0);
+  const [stats, setStats] = useState(null);
   
   // Filters
   const [filters, setFilters] = useState({
@@ -38,10 +39,14 @@ function ProductList() {
         ),
       };
       
-      const response = await productsAPI.list(params);
+      const [response, statsResponse] = await Promise.all([
+        productsAPI.list(params),
+        productsAPI.stats(),
+      ]);
       setProducts(response.data.items);
       setTotal(response.data.total);
       setTotalPages(response.data.total_pages);
+      setStats(statsResponse.data);
     } catch (error) {
       showNotification('Failed to load products', 'error');
     } finally {
@@ -151,6 +156,7 @@ function ProductList() {
         </button>
         <div className="pagination-info">
           Showing {products.length} of {total} products
+          {stats && ` (catalogue: ${stats.total} total, ${stats.active} active, ${stats.inactive} inactive)`}
         </div>
       </div>
 
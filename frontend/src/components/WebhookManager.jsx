@@ -266,6 +266,8 @@ function WebhookForm({ webhook, onClose, onSuccess }) {
               <option value="product_created">Product Created</option>
               <option value="product_updated">Product Updated</option>
               <option value="product_deleted">Product Deleted</option>
+              <option value="product_batch_created">Products Created (CSV import batch)</option>
+              <option value="product_batch_updated">Products Updated (CSV import batch)</option>
             </select>
           </div>
 
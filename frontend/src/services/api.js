@@ -13,6 +13,7 @@ const api = axios.create({
 export const productsAPI = {
   list: (params) => api.get('/products', { params }),
   get: (id) => api.get(`/products/${id}`),
+  stats: () => api.get('/products/stats'),
   create: (data) => api.post('/products', data),
   update: (id, data) => api.put(`/products/${id}`, data),
   delete: (id) => api.delete(`/products/${id}`),
@@ -30,6 +31,18 @@ export const uploadAPI = {
       },
     });
   },
+  // Resumable chunked uploads
+  createSession: (file) => api.post('/upload/sessions', { filename: file.name, size: file.size }),
+  getSession: (uploadId) => api.get(`/upload/sessions/${uploadId}`),
+  uploadChunk: (uploadId, file, start, end) =>
+    api.put(`/upload/sessions/${uploadId}`, file.slice(start, end), {
+      headers: {
+        'Content-Type': 'application/octet-stream',
+        'Content-Range': `bytes ${start}-${end - 1}/${file.size}`,
+      },
+    }),
+  finalize: (uploadId) => api.post(`/upload/sessions/${uploadId}/finalize`),
+  cancel: (jobId) => api.post(`/upload/${jobId}/cancel`),
   getProgress: (jobId) => {
     // EventSource is used directly in component for SSE
     return `${API_BASE_URL}/upload/progress/${jobId}`;